@@ -11,41 +11,82 @@ Features:
 - Enhanced security
 """
 
+import argparse
 import asyncio
+import bisect
+import contextlib
+import gc
+import hashlib
+import heapq
+import importlib.util
 import json
 import logging
+import math
+import mmap
 import os
+import re
+import signal
+import socket
+import sys
+import threading
+import time
 import uuid
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
-from dataclasses import dataclass, asdict
+from urllib.parse import parse_qs, urlsplit
+from typing import Any, Awaitable, Callable, ClassVar, Deque, Dict, Iterator, List, Optional, Tuple, Union
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field, is_dataclass
+from functools import cached_property
 from pathlib import Path
 
 # Core MCP imports
 from mcp import ClientSession, StdioServerParameters
 from mcp.server import NotificationOptions, Server
-from mcp.server.models import InitializeResult
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 from mcp.types import (
-    CallResult,
+    CallToolResult as CallResult,
     EmbeddedResource,
     ImageContent,
     ListResourcesResult,
     ListToolsResult,
-    ReadResourceResult,
     Resource,
+    SubscribeRequest,
     TextContent,
     Tool,
-    ToolResult,
 )
 
 # Enhanced dependencies
-import httpx
-import redis
 from pydantic import BaseModel, Field
-from groq import Groq
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import aiofiles
+
+def lazy_import(name: str):
+    """Return a module whose import is deferred until its first attribute access
+
+    Keeps heavy dependencies off the cold-start path; desktop clients spawn
+    a fresh server per session and wait for the initialize handshake.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+np = lazy_import("numpy")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -65,6 +106,91 @@ class ServerConfig:
     cache_ttl: int = 3600  # 1 hour
     rate_limit_requests: int = 100
     rate_limit_window: int = 60  # 1 minute
+    transport: str = os.getenv("MCP_TRANSPORT", "stdio")  # "stdio" or "http"
+    http_host: str = os.getenv("MCP_HTTP_HOST", "127.0.0.1")
+    http_port: int = int(os.getenv("MCP_HTTP_PORT", "8000"))
+    http_path: str = "/mcp"
+    max_connections: int = int(os.getenv("MCP_MAX_CONNECTIONS", "512"))  # concurrent HTTP connections incl. open streams, per worker
+    workers: int = int(os.getenv("MCP_WORKERS", "1"))  # pre-forked HTTP worker processes
+    # Seconds before a stopping worker is killed; must cover shutdown_drain_timeout, http_close_timeout,
+    # feedback_drain_timeout and resource_notify_timeout, which run one after another
+    worker_graceful_timeout: float = 40.0
+    shutdown_drain_timeout: float = 15.0  # seconds in-flight calls may finish once shutdown starts
+    http_close_timeout: float = 2.0  # seconds uvicorn waits for open connections (e.g. SSE streams) after the drain
+    worker_restart_delay: float = 1.0
+    memory_history_limit: int = 500  # interactions kept per session in Redis
+    memory_window: int = 50  # interactions kept resident per loaded session
+    memory_page_size: int = 20
+    memory_ttl: int = 7 * 24 * 3600  # 1 week
+    memory_cache_max_bytes: int = 32 * 1024 * 1024  # L1 budget
+    memory_cache_idle_ttl: int = 1800  # 30 minutes
+    memory_revalidate_interval: float = 5.0  # seconds an L1 entry is trusted blindly
+    analysis_workers: int = 2
+    topic_clusters: int = 5
+    topic_embedding_dim: int = 256
+    topic_refresh_after: int = 8  # new questions before clusters are recomputed
+    topic_max_pending: int = 1024  # unfolded questions kept per clusterer; oldest dropped beyond this
+    topic_max_sessions: int = 256  # per-session clusterers kept resident
+    sentiment_trend_window: int = 20  # recent interactions used for the rolling trend
+    analysis_cache_size: int = 1024
+    analysis_refresh_interval: float = 2.0  # seconds between background refreshes
+    analysis_hot_window: float = 60.0  # keys polled within this many seconds are kept warm
+    shared_state_refresh_interval: float = 2.0  # seconds between polls for other workers' priors and questions
+    topic_stream_length: int = 10000  # questions kept in dt:global:questions
+    feedback_queue_size: int = 10000
+    feedback_batch_size: int = 200
+    feedback_flush_interval: float = 1.0  # max seconds an event waits before its batch is flushed
+    feedback_enqueue_timeout: float = 0.25  # backpressure before rejecting when the queue is full
+    feedback_drain_timeout: float = 10.0
+    feedback_max_attempts: int = 5  # tries per batch before it is dropped as failed
+    feedback_retry_delay: float = 0.5  # seconds before the first retry, doubled on each further one
+    knowledge_base_path: str = os.getenv(
+        "DIGITAL_TWIN_KB", str(Path(__file__).with_name("digitaltwin-enhanced.json"))
+    )
+    retrieval_embedding_dim: int = 512
+    retrieval_top_k: int = 3
+    section_prior_strength: float = 0.2  # max score bias from feedback, +/- half of this
+    orchestration_max_concurrency: int = 4
+    orchestration_step_timeout: float = 30.0  # seconds
+    orchestration_memo_ttl: int = 300  # seconds a step result is reused across runs
+    orchestration_memo_size: int = 512
+    dedup_threshold: float = 0.8  # estimated Jaccard at which sources are merged
+    minhash_permutations: int = 64
+    minhash_bands: int = 16
+    shingle_size: int = 3  # words per shingle
+    synthesis_token_budget: int = 1000  # approx tokens of source text sent upstream
+    synthesis_max_sentences: int = 2000  # TextRank graph size cap
+    # Directories context_synthesis may read file sources from; none unless configured
+    source_roots: List[str] = field(default_factory=lambda: [
+        p for p in os.getenv("DIGITAL_TWIN_SOURCE_ROOTS", "").split(os.pathsep) if p
+    ])
+    source_chunk_chars: int = 64 * 1024
+    source_max_sentence_chars: int = 4096  # longer runs without a sentence break are split here
+    source_max_chars: int = 50 * 1024 * 1024  # stop reading a referenced source after this much
+    tool_timeout: float = 60.0  # default deadline per tool call, seconds
+    tool_timeouts: Dict[str, float] = field(default_factory=lambda: {
+        "memory_analysis": 10.0,
+        "adaptive_learning": 5.0,
+        "performance_analytics": 10.0,
+    })
+    tool_rate_limits: Dict[str, float] = field(default_factory=lambda: {
+        "advanced_query": 10.0,
+        "tool_orchestration": 2.0,
+        "context_synthesis": 5.0,
+    })  # calls per second, bursting up to the same number
+    tool_cache_ttl: float = 2.0  # seconds results of cacheable tools are shared
+    tool_cache_size: int = 256
+    tool_latency_window: int = 1000  # latency samples kept per tool
+    redis_pool_size: int = int(os.getenv("REDIS_POOL_SIZE", "20"))
+    redis_pool_timeout: float = 1.0  # max wait for a free pooled connection
+    redis_socket_timeout: float = 2.0  # per command, so a slow Redis fails fast instead of stalling calls
+    redis_latency_window: int = 1000  # latency samples kept per command
+    reasoning_chain_limit: int = 10000  # chains retained for reasoning://chains
+    reasoning_page_size: int = 20
+    reasoning_max_page_size: int = 100
+    resource_notify_interval: float = 1.0  # min seconds between updates per resource, i.e. the max notification rate
+    resource_notify_timeout: float = 5.0
+    json_format: str = os.getenv("MCP_JSON_FORMAT", "compact")  # "compact" for machine clients, "pretty" for people
 
 # Enhanced data models
 class ReasoningStep(BaseModel):
@@ -77,36 +203,2470 @@ class ReasoningStep(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
     dependencies: List[str] = Field(default_factory=list)
 
+class _ChainLog:
+    """Ascending (seq, created) log of chains; trimmed from the front"""
+
+    __slots__ = ("seqs", "times", "start")
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.times: List[float] = []
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.start
+
+    def append(self, seq: int, created: float) -> None:
+        self.seqs.append(seq)
+        self.times.append(created)
+
+    def trim(self, seq: int) -> None:
+        """Drop entries up to and including seq"""
+        while self.start < len(self.seqs) and self.seqs[self.start] <= seq:
+            self.start += 1
+        if self.start > 1024 and self.start * 2 > len(self.seqs):
+            del self.seqs[:self.start]
+            del self.times[:self.start]
+            self.start = 0
+
+    def page(
+        self, before: Optional[int], since: Optional[float], until: Optional[float], limit: int
+    ) -> Tuple[List[int], Optional[int]]:
+        """Newest-first seqs older than ``before`` within [since, until], and the next cursor"""
+        hi = len(self.seqs) if before is None else bisect.bisect_left(self.seqs, before, self.start)
+        if until is not None:
+            hi = min(hi, bisect.bisect_right(self.times, until, self.start))
+        lo = self.start if since is None else bisect.bisect_left(self.times, since, self.start)
+        if hi <= lo:
+            return [], None
+        seqs = self.seqs[max(lo, hi - limit):hi][::-1]
+        return seqs, (seqs[-1] if hi - lo > limit else None)
+
+@dataclass
+class ReasoningChain:
+    chain_id: str
+    seq: int
+    mode: str
+    created: float  # epoch seconds, non-decreasing across chains
+    steps: List[ReasoningStep] = field(default_factory=list)
+
+class ReasoningChainIndex:
+    """Retained reasoning chains with counters and cursor pagination
+
+    Chains get increasing sequence numbers and are logged once overall
+    and once per reasoning mode, both in creation order. A page is a
+    bisect into one log followed by a slice, so reading costs
+    O(log n + page size), and the totals are counters kept up to date on
+    every write. Beyond ``limit`` chains the oldest are evicted.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._chains: Dict[str, ReasoningChain] = {}
+        self._by_seq: Dict[int, ReasoningChain] = {}
+        self._log = _ChainLog()
+        self._mode_logs: Dict[str, _ChainLog] = {}
+        self._next_seq = 0
+        self._last_created = 0.0
+        self.total_steps = 0
+        self.mode_counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._chains)
+
+    def __contains__(self, chain_id: str) -> bool:
+        return chain_id in self._chains
+
+    def create(self, chain_id: str, mode: str) -> ReasoningChain:
+        self._last_created = max(self._last_created, time.time())
+        chain = ReasoningChain(chain_id=chain_id, seq=self._next_seq, mode=mode, created=self._last_created)
+        self._next_seq += 1
+        self._chains[chain_id] = chain
+        self._by_seq[chain.seq] = chain
+        self._log.append(chain.seq, chain.created)
+        self._mode_logs.setdefault(mode, _ChainLog()).append(chain.seq, chain.created)
+        self.mode_counts[mode] = self.mode_counts.get(mode, 0) + 1
+        while len(self._chains) > self.limit:
+            self._evict_oldest()
+        return chain
+
+    def add_step(self, chain_id: str, step: ReasoningStep) -> None:
+        chain = self._chains.get(chain_id)
+        if chain is not None:
+            chain.steps.append(step)
+            self.total_steps += 1
+
+    def steps(self, chain_id: str) -> List[ReasoningStep]:
+        chain = self._chains.get(chain_id)
+        return chain.steps if chain else []
+
+    def _evict_oldest(self) -> None:
+        chain = self._by_seq.pop(self._log.seqs[self._log.start])
+        del self._chains[chain.chain_id]
+        self._log.trim(chain.seq)
+        self._mode_logs[chain.mode].trim(chain.seq)
+        self.total_steps -= len(chain.steps)
+        self.mode_counts[chain.mode] -= 1
+        if not self.mode_counts[chain.mode]:
+            del self.mode_counts[chain.mode]
+            del self._mode_logs[chain.mode]
+
+    def page(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 20,
+        mode: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Tuple[List[ReasoningChain], Optional[int]]:
+        """Newest-first chains created before the ``cursor`` chain, and the next cursor"""
+        log = self._log if mode is None else self._mode_logs.get(mode)
+        if log is None:
+            return [], None
+        seqs, next_cursor = log.page(cursor, since, until, limit)
+        return [self._by_seq[seq] for seq in seqs], next_cursor
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before work completes"""
+
+@dataclass
+class RequestContext:
+    """Deadline and cancellation token for one tool call
+
+    Set as a context variable by the with_deadline middleware, so every coroutine
+    and task spawned for the call sees it through ``current_request()``.
+    Awaitables on the request path go through ``run`` to be bounded by
+    the remaining time; blocking work calls ``check`` between units of
+    work, and work handed to a thread gets ``cancel_token`` and checks it
+    with ``check_cancelled``. The token is set once nobody waits for the
+    result any more, whether the call finished, timed out or was cancelled.
+    """
+    tool: str
+    deadline: float  # time.monotonic() based
+    cancel_token: threading.Event = field(default_factory=threading.Event)
+    timed_out: bool = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self) -> None:
+        self.cancel_token.set()
+
+    def check(self, what: str = "") -> None:
+        if self.cancel_token.is_set():
+            raise asyncio.CancelledError(what)
+        if self.remaining() <= 0:
+            self.timed_out = True
+            raise DeadlineExceeded(f"Deadline exceeded for {self.tool}{': ' + what if what else ''}")
+
+    async def run(self, awaitable, what: str = ""):
+        """Await with the remaining time budget"""
+        try:
+            self.check(what)
+        except BaseException:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            raise DeadlineExceeded(f"Deadline exceeded for {self.tool}{': ' + what if what else ''}")
+
+_request_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+def check_cancelled(cancel_token: Optional[threading.Event], what: str = "") -> None:
+    """Stop threaded work whose result is no longer wanted"""
+    if cancel_token is not None and cancel_token.is_set():
+        raise asyncio.CancelledError(what)
+
+def current_request() -> RequestContext:
+    """The active request context, or an unbounded one outside tool calls"""
+    return _request_context.get() or RequestContext(tool="background", deadline=float("inf"))
+
+TOPIC_KEYWORDS: Dict[str, List[str]] = {
+    "AI": ["ai", "ml", "llm", "model", "machine", "learning", "neural", "rag", "embedding", "agent", "gpt"],
+    "Programming": ["code", "python", "typescript", "javascript", "api", "bug", "debug", "react", "next", "function"],
+    "Career Development": ["career", "job", "interview", "role", "salary", "resume", "hiring", "promotion", "team"],
+    "Projects": ["project", "portfolio", "built", "build", "deploy", "deployment", "app", "github"],
+    "Education": ["study", "school", "university", "course", "degree", "certification", "learn"],
+}
+
+SENTIMENT_LEXICON: Dict[str, float] = {
+    "great": 1.0, "good": 0.6, "excellent": 1.0, "amazing": 1.0, "love": 0.9, "like": 0.4,
+    "helpful": 0.8, "thanks": 0.6, "thank": 0.6, "awesome": 1.0, "clear": 0.5, "perfect": 1.0,
+    "bad": -0.6, "wrong": -0.7, "terrible": -1.0, "hate": -0.9, "confusing": -0.6, "useless": -0.9,
+    "slow": -0.4, "broken": -0.8, "error": -0.3, "poor": -0.6, "unclear": -0.5, "annoying": -0.7,
+}
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i in is it me my of on or "
+    "so that the this to was what when where which who why will with you your about "
+    "tell have has had would could should there their them they we our".split()
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used by topic and sentiment extraction"""
+    return _TOKEN_RE.findall((text or "").lower())
+
+def extract_topics(text: str) -> List[str]:
+    """Return the topics whose keywords appear in text"""
+    tokens = set(tokenize(text))
+    return [topic for topic, keywords in TOPIC_KEYWORDS.items() if tokens.intersection(keywords)]
+
+def interaction_time(interaction: Dict[str, Any]) -> datetime:
+    """Timestamp of a recorded interaction, defaulting to now"""
+    timestamp = interaction.get("timestamp")
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp)
+    return timestamp or datetime.now()
+
+NEGATIONS = frozenset(["not", "no", "never", "isn't", "wasn't", "don't", "doesn't", "didn't", "can't"])
+
+class SentimentScorer:
+    """Batch lexicon sentiment scorer
+
+    The lexicon is compiled once into a token -> id table and a polarity
+    array. A batch of texts becomes two flat arrays (token ids and the
+    text each token belongs to), and per-text scores are NumPy reductions
+    over them, so scoring thousands of messages needs no model call.
+    A lexicon term directly after a negation has its polarity flipped.
+    """
+
+    def __init__(self, lexicon: Dict[str, float]):
+        self.lexicon = lexicon
+        self.vocabulary = {term: index for index, term in enumerate(lexicon)}
+
+    @cached_property
+    def polarity(self) -> "np.ndarray":
+        return np.fromiter(self.lexicon.values(), dtype=np.float64, count=len(self.lexicon))
+
+    def score_batch(self, texts: List[str]) -> "np.ndarray":
+        """Mean polarity per text in [-1, 1]; 0.0 where no terms match"""
+        ids: List[int] = []
+        owners: List[int] = []
+        signs: List[float] = []
+        vocabulary = self.vocabulary
+        for owner, text in enumerate(texts):
+            previous = ""
+            for token in tokenize(text):
+                term_id = vocabulary.get(token)
+                if term_id is not None:
+                    ids.append(term_id)
+                    owners.append(owner)
+                    signs.append(-1.0 if previous in NEGATIONS else 1.0)
+                previous = token
+        if not ids:
+            return np.zeros(len(texts))
+        weights = self.polarity[np.asarray(ids)] * np.asarray(signs)
+        owner_index = np.asarray(owners)
+        totals = np.bincount(owner_index, weights=weights, minlength=len(texts))
+        matches = np.bincount(owner_index, minlength=len(texts))
+        return np.divide(totals, matches, out=np.zeros(len(texts)), where=matches > 0)
+
+    @staticmethod
+    def trend(scores: "np.ndarray") -> float:
+        """Least-squares slope of scores over their order (per interaction)"""
+        if len(scores) < 2:
+            return 0.0
+        x = np.arange(len(scores), dtype=np.float64)
+        x -= x.mean()
+        return float((x * (scores - scores.mean())).sum() / (x ** 2).sum())
+
+SENTIMENT_SCORER = SentimentScorer(SENTIMENT_LEXICON)
+
+def score_sentiment(text: str) -> float:
+    """Sentiment of a single text, see SentimentScorer"""
+    return float(SENTIMENT_SCORER.score_batch([text])[0])
+
+class InteractionAggregates(BaseModel):
+    """Running per-session analytics maintained on every write
+
+    Every field is either a counter or a running sum, so recording an
+    interaction is O(1) and analyses never rescan the history. In Redis
+    the aggregates live in one hash updated with HINCRBY/HINCRBYFLOAT.
+    """
+    interaction_count: int = 0
+    topic_counts: Dict[str, int] = Field(default_factory=dict)
+    mode_counts: Dict[str, int] = Field(default_factory=dict)
+    hour_histogram: List[int] = Field(default_factory=lambda: [0] * 24)
+    sentiment_sum: float = 0.0
+    sentiment_count: int = 0
+    sentiment_ema: float = 0.0
+    question_chars: int = 0
+    follow_ups: int = 0
+    last_timestamp: Optional[datetime] = None
+
+    SENTIMENT_EMA_ALPHA: ClassVar[float] = 0.2
+    FOLLOW_UP_WINDOW: ClassVar[int] = 300  # seconds
+
+    def record(self, interaction: Dict[str, Any]) -> Tuple[Dict[str, float], Dict[str, str]]:
+        """Fold one interaction in and return (redis increments, redis sets)"""
+        timestamp = interaction_time(interaction)
+        increments: Dict[str, float] = {"count": 1, f"hour:{timestamp.hour}": 1}
+        sets: Dict[str, str] = {"last_timestamp": timestamp.isoformat()}
+
+        self.interaction_count += 1
+        self.hour_histogram[timestamp.hour] += 1
+
+        for topic in interaction.get("topics", []):
+            self.topic_counts[topic] = self.topic_counts.get(topic, 0) + 1
+            increments[f"topic:{topic}"] = 1
+
+        mode = interaction.get("reasoning_mode")
+        if mode:
+            self.mode_counts[mode] = self.mode_counts.get(mode, 0) + 1
+            increments[f"mode:{mode}"] = 1
+
+        question_chars = len(interaction.get("question", ""))
+        self.question_chars += question_chars
+        increments["question_chars"] = question_chars
+
+        sentiment = interaction.get("sentiment")
+        if sentiment is not None:
+            if self.sentiment_count:
+                alpha = self.SENTIMENT_EMA_ALPHA
+                self.sentiment_ema = (1 - alpha) * self.sentiment_ema + alpha * sentiment
+            else:
+                self.sentiment_ema = sentiment
+            self.sentiment_sum += sentiment
+            self.sentiment_count += 1
+            increments["sentiment_sum"] = sentiment
+            increments["sentiment_count"] = 1
+            sets["sentiment_ema"] = repr(self.sentiment_ema)
+
+        if self.last_timestamp and 0 <= (timestamp - self.last_timestamp).total_seconds() <= self.FOLLOW_UP_WINDOW:
+            self.follow_ups += 1
+            increments["follow_ups"] = 1
+        self.last_timestamp = timestamp
+        return increments, sets
+
+    @classmethod
+    def from_redis(cls, raw: Dict[str, str]) -> "InteractionAggregates":
+        aggregates = cls()
+        for field, value in (raw or {}).items():
+            prefix, _, name = field.partition(":")
+            if prefix == "topic":
+                aggregates.topic_counts[name] = int(value)
+            elif prefix == "mode":
+                aggregates.mode_counts[name] = int(value)
+            elif prefix == "hour":
+                aggregates.hour_histogram[int(name)] = int(value)
+            elif field == "count":
+                aggregates.interaction_count = int(value)
+            elif field == "last_timestamp":
+                aggregates.last_timestamp = datetime.fromisoformat(value)
+            elif field in ("sentiment_sum", "sentiment_ema"):
+                setattr(aggregates, field, float(value))
+            elif field in ("sentiment_count", "question_chars", "follow_ups"):
+                setattr(aggregates, field, int(value))
+        return aggregates
+
+    @classmethod
+    def merge(cls, parts: List["InteractionAggregates"]) -> "InteractionAggregates":
+        """Combine aggregates from several sessions"""
+        merged = cls()
+        for part in parts:
+            merged.interaction_count += part.interaction_count
+            for topic, count in part.topic_counts.items():
+                merged.topic_counts[topic] = merged.topic_counts.get(topic, 0) + count
+            for mode, count in part.mode_counts.items():
+                merged.mode_counts[mode] = merged.mode_counts.get(mode, 0) + count
+            merged.hour_histogram = [a + b for a, b in zip(merged.hour_histogram, part.hour_histogram)]
+            merged.sentiment_sum += part.sentiment_sum
+            merged.sentiment_ema += part.sentiment_ema * part.sentiment_count
+            merged.sentiment_count += part.sentiment_count
+            merged.question_chars += part.question_chars
+            merged.follow_ups += part.follow_ups
+        if merged.sentiment_count:
+            merged.sentiment_ema /= merged.sentiment_count
+        return merged
+
+# time_range -> (bucket granularity, span), both in seconds
+TIME_RANGE_BUCKETS: Dict[str, Tuple[int, int]] = {
+    "last_hour": (300, 3600),
+    "last_day": (3600, 24 * 3600),
+    "last_week": (24 * 3600, 7 * 24 * 3600),
+}
+MAX_BUCKET_RETENTION = max(span + granularity for granularity, span in TIME_RANGE_BUCKETS.values())
+
+class TimeBucketIndex(BaseModel):
+    """Interactions indexed by time as pre-rolled per-bucket aggregates
+
+    Every interaction is folded into one bucket per granularity, so a
+    time_range query merges only the handful of buckets overlapping the
+    range (13, 25 or 8) instead of scanning history. Ranges are resolved
+    to whole buckets, so the oldest edge is accurate to one granularity.
+    """
+    buckets: Dict[int, Dict[int, InteractionAggregates]] = Field(
+        default_factory=lambda: {granularity: {} for granularity, _ in TIME_RANGE_BUCKETS.values()}
+    )
+
+    def record(self, interaction: Dict[str, Any]) -> List[Tuple[int, int, Dict[str, float], Dict[str, str]]]:
+        """Fold an interaction into its buckets
+
+        Returns (granularity, bucket start, increments, sets) per bucket
+        touched so the store can mirror the update in Redis.
+        """
+        ts = interaction_time(interaction).timestamp()
+        touched = []
+        for granularity, span in TIME_RANGE_BUCKETS.values():
+            start = int(ts // granularity) * granularity
+            buckets = self.buckets[granularity]
+            increments, sets = buckets.setdefault(start, InteractionAggregates()).record(interaction)
+            touched.append((granularity, start, increments, sets))
+            cutoff = ts - span - granularity
+            for stale in [s for s in buckets if s < cutoff]:
+                del buckets[stale]
+        return touched
+
+    def load_bucket(self, granularity: int, start: int, raw: Dict[str, str]) -> None:
+        if granularity in self.buckets:
+            self.buckets[granularity][start] = InteractionAggregates.from_redis(raw)
+
+    def query(self, time_range: str, now: Optional[datetime] = None) -> InteractionAggregates:
+        """Merge the buckets overlapping time_range"""
+        granularity, span = TIME_RANGE_BUCKETS[time_range]
+        cutoff = (now or datetime.now()).timestamp() - span
+        return InteractionAggregates.merge([
+            aggregates for start, aggregates in self.buckets[granularity].items()
+            if start + granularity > cutoff
+        ])
+
 class AgentMemory(BaseModel):
-    """Enhanced agent memory system"""
+    """Enhanced agent memory system
+
+    ``interaction_history`` is a ring buffer holding only the most recent
+    window of interactions; older entries stay in Redis and are paged in
+    on demand through ``SessionMemoryStore.get_history_page``.
+    """
     conversation_id: str
     user_profile: Dict[str, Any] = Field(default_factory=dict)
     preferences: Dict[str, Any] = Field(default_factory=dict)
-    interaction_history: List[Dict[str, Any]] = Field(default_factory=list)
+    interaction_history: Deque[Dict[str, Any]] = Field(default_factory=deque)
     learned_patterns: Dict[str, Any] = Field(default_factory=dict)
+    aggregates: InteractionAggregates = Field(default_factory=InteractionAggregates)
+    time_index: TimeBucketIndex = Field(default_factory=TimeBucketIndex)
     last_updated: datetime = Field(default_factory=datetime.now)
+    version: int = 0  # bumped in Redis on every write
+
+class LatencySamples:
+    """Recent latencies per operation name, in milliseconds"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, elapsed_ms: float, ok: bool = True) -> None:
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.window)
+        samples.append(elapsed_ms)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for name, samples in self._samples.items():
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": len(ordered),
+                "avg_ms": round(sum(ordered) / len(ordered), 2),
+                "p50_ms": round(ordered[len(ordered) // 2], 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                "errors": self.errors.get(name, 0),
+            }
+        return summary
+
+class SessionMemoryStore:
+    """Redis-backed persistence for AgentMemory
+
+    Layout per session (all keys share the session TTL):
+    - ``dt:memory:{id}:profile`` / ``:preferences`` / ``:patterns``: hashes,
+      one JSON-encoded value per field so updates touch only changed fields
+    - ``dt:memory:{id}:history``: list, newest first, capped with LTRIM
+    - ``dt:memory:{id}:aggregates``: hash of InteractionAggregates counters
+    - ``dt:memory:{id}:bucket:{granularity}:{start}``: the same counters per
+      time bucket, listed in the ``dt:memory:{id}:buckets`` sorted set
+      scored by bucket start
+    - ``dt:memory:{id}:meta``: hash with last_updated and a version stamp
+      that is incremented on every write
+
+    Cross-session analytics live under ``dt:global``: the same counters in
+    ``dt:global:aggregates`` and ``dt:global:bucket:{granularity}:{start}``,
+    the latest interactions in the capped ``dt:global:recent`` list and a
+    version stamp in ``dt:global:meta``. They are incremented in the same
+    pipeline as the session keys, so "all sessions" covers every session
+    and worker, resident or not. Each question is also added to the capped
+    ``dt:global:questions`` stream, tagged with the writing process, so
+    every worker's cross-session topic clusters see the others' questions.
+
+    The client is a redis.asyncio client. Every multi-key read or write is
+    one pipeline, and each pipeline or command is timed into ``latency``.
+    """
+
+    HASH_SECTIONS = {
+        "user_profile": "profile",
+        "preferences": "preferences",
+        "learned_patterns": "patterns",
+    }
+
+    GLOBAL_PREFIX = "dt:global"
+
+    def __init__(self, config: ServerConfig, redis_client=None):
+        self.config = config
+        self.redis = redis_client
+        self.latency = LatencySamples(config.redis_latency_window)
+        # In-process stand-ins for the dt:global:* keys while Redis is unavailable
+        self._global_counters: Dict[str, Any] = {}
+        self._global_buckets: Dict[str, Dict[str, Any]] = {}
+        self._global_recent: Deque[Dict[str, Any]] = deque(maxlen=config.sentiment_trend_window)
+        self._global_version = 0
+
+    async def timed(self, command: str, awaitable) -> Any:
+        """Await a Redis command or pipeline, recording its latency under command"""
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await awaitable
+            ok = True
+            return result
+        finally:
+            self.latency.record(command, (time.perf_counter() - started) * 1000, ok)
+
+    def attach(self, redis_client) -> None:
+        """Switch to Redis, dropping the in-process global stand-ins"""
+        self.redis = redis_client
+        self._global_counters = {}
+        self._global_buckets = {}
+        self._global_recent.clear()
+
+    @property
+    def origin(self) -> str:
+        """Tag of this store's writes in dt:global:questions; workers fork after construction"""
+        return f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+    def _key(self, session_id: str, part: str) -> str:
+        return f"dt:memory:{session_id}:{part}"
+
+    def _global_key(self, part: str) -> str:
+        return f"{self.GLOBAL_PREFIX}:{part}"
+
+    def _new_memory(self, session_id: str) -> AgentMemory:
+        memory = AgentMemory(conversation_id=session_id)
+        memory.interaction_history = deque(maxlen=self.config.memory_window)
+        return memory
+
+    @staticmethod
+    def _decode_hash(raw: Dict[str, str]) -> Dict[str, Any]:
+        return {field: json.loads(value) for field, value in (raw or {}).items()}
+
+    async def load(self, session_id: str) -> AgentMemory:
+        """Load a session's hashes and the most recent history window"""
+        memory = self._new_memory(session_id)
+        if not self.redis:
+            return memory
+
+        pipe = self.redis.pipeline()
+        for part in self.HASH_SECTIONS.values():
+            pipe.hgetall(self._key(session_id, part))
+        pipe.lrange(self._key(session_id, "history"), 0, self.config.memory_window - 1)
+        pipe.hgetall(self._key(session_id, "aggregates"))
+        pipe.hmget(self._key(session_id, "meta"), "last_updated", "version")
+        *hashes, history, aggregates, (last_updated, version) = await self.timed("load", pipe.execute())
+
+        for attr, raw in zip(self.HASH_SECTIONS, hashes):
+            setattr(memory, attr, self._decode_hash(raw))
+        # Redis keeps newest first; the resident window is oldest first
+        memory.interaction_history.extend(json.loads(item) for item in reversed(history))
+        memory.aggregates = InteractionAggregates.from_redis(aggregates)
+        await self._load_time_index(memory)
+        if last_updated:
+            memory.last_updated = datetime.fromisoformat(last_updated)
+        memory.version = int(version or 0)
+        return memory
+
+    async def _load_time_index(self, memory: AgentMemory) -> None:
+        """Fetch the buckets still inside the retention window"""
+        session_id = memory.conversation_id
+        cutoff = datetime.now().timestamp() - MAX_BUCKET_RETENTION
+        members = await self.timed(
+            "zrangebyscore", self.redis.zrangebyscore(self._key(session_id, "buckets"), cutoff, "+inf")
+        )
+        if not members:
+            return
+        pipe = self.redis.pipeline()
+        for member in members:
+            pipe.hgetall(self._key(session_id, f"bucket:{member}"))
+        for member, raw in zip(members, await self.timed("load_buckets", pipe.execute())):
+            granularity, start = (int(part) for part in member.split(":"))
+            memory.time_index.load_bucket(granularity, start, raw)
+
+    async def get_version(self, session_id: str) -> int:
+        """Return the current version stamp of a session (one HGET)"""
+        if not self.redis:
+            return 0
+        return int(await self.timed("hget", self.redis.hget(self._key(session_id, "meta"), "version")) or 0)
+
+    async def get_global_version(self) -> int:
+        """Return the version stamp of the cross-session aggregates (one HGET)"""
+        if not self.redis:
+            return self._global_version
+        return int(await self.timed("hget", self.redis.hget(self._global_key("meta"), "version")) or 0)
+
+    async def load_global(self, time_range: str) -> Tuple[InteractionAggregates, List[Dict[str, Any]]]:
+        """Cross-session aggregates for time_range and the latest interactions, oldest first
+
+        Reads the global hash, or the handful of global buckets overlapping
+        the range, plus the recent list; the cost does not depend on the
+        number of sessions.
+        """
+        members: Optional[List[str]] = None
+        if time_range in TIME_RANGE_BUCKETS:
+            granularity, span = TIME_RANGE_BUCKETS[time_range]
+            now = time.time()
+            first = int((now - span) // granularity) * granularity
+            members = [f"{granularity}:{start}" for start in range(first, int(now) + 1, granularity)]
+
+        if not self.redis:
+            if members is None:
+                parts = [self._global_counters]
+            else:
+                parts = [self._global_buckets.get(member) for member in members]
+            recent = list(self._global_recent)
+        else:
+            pipe = self.redis.pipeline()
+            if members is None:
+                pipe.hgetall(self._global_key("aggregates"))
+            else:
+                for member in members:
+                    pipe.hgetall(self._global_key(f"bucket:{member}"))
+            pipe.lrange(self._global_key("recent"), 0, self.config.sentiment_trend_window - 1)
+            *parts, raw_recent = await self.timed("load_global", pipe.execute())
+            recent = [json.loads(item) for item in raw_recent]
+
+        aggregates = InteractionAggregates.merge([InteractionAggregates.from_redis(part) for part in parts if part])
+        # Both the list and the deque keep newest first
+        return aggregates, recent[::-1]
+
+    async def read_global_questions(self, after: str, count: int) -> Tuple[List[str], str]:
+        """Questions other processes added to dt:global:questions after stream id after
+
+        Returns them with the last id read, to pass as after next time.
+        """
+        response = await self.timed(
+            "xread", self.redis.xread({self._global_key("questions"): after}, count=count)
+        )
+        questions = []
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                after = entry_id
+                if fields.get("origin") != self.origin:
+                    questions.append(fields.get("question", ""))
+        return questions, after
+
+    async def get_history_page(
+        self, session_id: str, cursor: int = 0, limit: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return one page of history (newest first) and the next cursor"""
+        limit = limit or self.config.memory_page_size
+        if not self.redis:
+            return [], None
+        raw = await self.timed("lrange", self.redis.lrange(self._key(session_id, "history"), cursor, cursor + limit - 1))
+        items = [json.loads(item) for item in raw]
+        next_cursor = cursor + len(items) if len(items) == limit else None
+        return items, next_cursor
+
+    async def append_interaction(self, memory: AgentMemory, interaction: Dict[str, Any]) -> None:
+        """Append to the resident window and the capped Redis list
+
+        The session and global aggregates are folded forward in the same
+        pipeline.
+        """
+        memory.interaction_history.append(interaction)
+        increments, sets = memory.aggregates.record(interaction)
+        touched_buckets = memory.time_index.record(interaction)
+        memory.last_updated = datetime.now()
+        # Global counters take the session deltas; the EMA only makes sense per session
+        global_sets = {"last_timestamp": sets["last_timestamp"]}
+        recent = {field: interaction.get(field) for field in ("question", "sentiment", "timestamp")}
+        if not self.redis:
+            self._fold_global(increments, global_sets, touched_buckets, recent)
+            memory.version += 1
+            return
+
+        session_id = memory.conversation_id
+        history_key = self._key(session_id, "history")
+        aggregates_key = self._key(session_id, "aggregates")
+        pipe = self.redis.pipeline()
+        pipe.lpush(history_key, json.dumps(interaction, default=str))
+        pipe.ltrim(history_key, 0, self.config.memory_history_limit - 1)
+        self._increment(pipe, aggregates_key, increments)
+        pipe.hset(aggregates_key, mapping=sets)
+
+        index_key = self._key(session_id, "buckets")
+        for granularity, start, bucket_increments, bucket_sets in touched_buckets:
+            member = f"{granularity}:{start}"
+            bucket_key = self._key(session_id, f"bucket:{member}")
+            self._increment(pipe, bucket_key, bucket_increments)
+            pipe.hset(bucket_key, mapping=bucket_sets)
+            pipe.expire(bucket_key, MAX_BUCKET_RETENTION)
+            pipe.zadd(index_key, {member: start})
+        pipe.zremrangebyscore(index_key, "-inf", datetime.now().timestamp() - MAX_BUCKET_RETENTION)
+
+        global_aggregates_key = self._global_key("aggregates")
+        self._increment(pipe, global_aggregates_key, increments)
+        pipe.hset(global_aggregates_key, mapping=global_sets)
+        for granularity, start, bucket_increments, _ in touched_buckets:
+            bucket_key = self._global_key(f"bucket:{granularity}:{start}")
+            self._increment(pipe, bucket_key, bucket_increments)
+            pipe.hset(bucket_key, mapping=global_sets)
+            pipe.expire(bucket_key, MAX_BUCKET_RETENTION)
+        recent_key = self._global_key("recent")
+        pipe.lpush(recent_key, json.dumps(recent, default=str))
+        pipe.ltrim(recent_key, 0, self.config.sentiment_trend_window - 1)
+        pipe.hincrby(self._global_key("meta"), "version", 1)
+        if interaction.get("question"):
+            pipe.xadd(
+                self._global_key("questions"),
+                {"question": interaction["question"], "origin": self.origin},
+                maxlen=self.config.topic_stream_length,
+                approximate=True,
+            )
+        await self._commit("append_interaction", pipe, memory, [history_key, aggregates_key, index_key])
+
+    @staticmethod
+    def _increment(pipe, key: str, increments: Dict[str, float]) -> None:
+        for field, amount in increments.items():
+            if isinstance(amount, float):
+                pipe.hincrbyfloat(key, field, amount)
+            else:
+                pipe.hincrby(key, field, amount)
+
+    def _fold_global(
+        self,
+        increments: Dict[str, float],
+        sets: Dict[str, str],
+        touched_buckets: List[Tuple[int, int, Dict[str, float], Dict[str, str]]],
+        recent: Dict[str, Any],
+    ) -> None:
+        """Apply a write to the in-process global counters, as the pipeline does in Redis"""
+        def fold(counters: Dict[str, Any], deltas: Dict[str, float]) -> None:
+            for field, amount in deltas.items():
+                counters[field] = counters.get(field, 0) + amount
+            counters.update(sets)
+
+        fold(self._global_counters, increments)
+        for granularity, start, bucket_increments, _ in touched_buckets:
+            fold(self._global_buckets.setdefault(f"{granularity}:{start}", {}), bucket_increments)
+        cutoff = time.time() - MAX_BUCKET_RETENTION
+        for member in [m for m in self._global_buckets if int(m.partition(":")[2]) < cutoff]:
+            del self._global_buckets[member]
+        self._global_recent.appendleft(recent)
+        self._global_version += 1
+
+    async def update_fields(self, memory: AgentMemory, section: str, fields: Dict[str, Any]) -> None:
+        """Apply an incremental update to one hash section
+
+        Only fields whose value actually changed are written.
+        """
+        if section not in self.HASH_SECTIONS:
+            raise ValueError(f"Unknown memory section: {section}")
+
+        current = getattr(memory, section)
+        changed = {k: v for k, v in fields.items() if current.get(k) != v}
+        if not changed:
+            return
+        current.update(changed)
+        memory.last_updated = datetime.now()
+        if not self.redis:
+            memory.version += 1
+            return
+
+        hash_key = self._key(memory.conversation_id, self.HASH_SECTIONS[section])
+        pipe = self.redis.pipeline()
+        pipe.hset(hash_key, mapping={k: json.dumps(v, default=str) for k, v in changed.items()})
+        await self._commit("update_fields", pipe, memory, [hash_key])
+
+    async def _commit(self, command: str, pipe, memory: AgentMemory, keys: List[str]) -> None:
+        """Stamp meta, refresh TTLs and execute, recording the new version"""
+        meta_key = self._key(memory.conversation_id, "meta")
+        pipe.hset(meta_key, "last_updated", memory.last_updated.isoformat())
+        version_index = len(pipe)
+        pipe.hincrby(meta_key, "version", 1)
+        for key in [*keys, meta_key]:
+            pipe.expire(key, self.config.memory_ttl)
+        results = await self.timed(command, pipe.execute())
+        memory.version = int(results[version_index])
+
+@dataclass
+class _MemoryCacheEntry:
+    memory: AgentMemory
+    size: int
+    validated_at: float
+    last_access: float
+
+class TwoTierMemoryCache:
+    """L1 in-process LRU (byte budget) in front of the Redis-backed store
+
+    L1 entries are served without touching Redis for
+    ``memory_revalidate_interval`` seconds after they were loaded, written
+    or revalidated. After that a single HGET of the version stamp decides
+    whether the entry is still current or must be reloaded from L2.
+    Writes go through this cache so the local copy and stamp stay in sync;
+    a write that fails in Redis evicts the entry, since the store has
+    already applied it to the resident copy.
+    """
+
+    def __init__(self, store: SessionMemoryStore, config: ServerConfig):
+        self.store = store
+        self.config = config
+        self._entries: "OrderedDict[str, _MemoryCacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {"l1_hits": 0, "l2_revalidations": 0, "l2_loads": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    @staticmethod
+    def _estimate_size(memory: AgentMemory) -> int:
+        size = len(memory.conversation_id)
+        for section in (memory.user_profile, memory.preferences, memory.learned_patterns):
+            size += len(json.dumps(section, default=str))
+        size += sum(len(json.dumps(item, default=str)) for item in memory.interaction_history)
+        return size
+
+    async def get(self, session_id: str) -> AgentMemory:
+        """Return a session's memory, loading or revalidating as needed"""
+        now = time.monotonic()
+        entry = self._entries.get(session_id)
+        if entry and now - entry.last_access > self.config.memory_cache_idle_ttl:
+            self.evict(session_id)
+            entry = None
+
+        if entry:
+            self._entries.move_to_end(session_id)
+            entry.last_access = now
+            if not self.store.redis or now - entry.validated_at < self.config.memory_revalidate_interval:
+                self.stats["l1_hits"] += 1
+                return entry.memory
+            current_request().check("memory revalidation")
+            if await self.store.get_version(session_id) == entry.memory.version:
+                self.stats["l2_revalidations"] += 1
+                entry.validated_at = now
+                return entry.memory
+            self.evict(session_id)
+
+        self.stats["l2_loads"] += 1
+        current_request().check("memory load")
+        memory = await self.store.load(session_id)
+        self._put(session_id, memory)
+        return memory
+
+    async def append_interaction(self, session_id: str, interaction: Dict[str, Any]) -> AgentMemory:
+        memory = await self.get(session_id)
+        current_request().check("memory write")
+        expected = memory.version + 1
+        try:
+            await self.store.append_interaction(memory, interaction)
+        except BaseException:
+            self._after_failed_write(session_id)
+            raise
+        self._after_write(session_id, memory, expected)
+        return memory
+
+    async def update_fields(self, session_id: str, section: str, fields: Dict[str, Any]) -> AgentMemory:
+        memory = await self.get(session_id)
+        previous = memory.version
+        try:
+            await self.store.update_fields(memory, section, fields)
+        except BaseException:
+            self._after_failed_write(session_id)
+            raise
+        self._after_write(session_id, memory, previous + 1 if memory.version != previous else previous)
+        return memory
+
+    def _after_failed_write(self, session_id: str) -> None:
+        if self.store.redis:
+            # The resident copy may hold a write Redis never received; without
+            # Redis it is the only copy, so it is kept
+            self.evict(session_id)
+
+    def _after_write(self, session_id: str, memory: AgentMemory, expected_version: int) -> None:
+        if self.store.redis and memory.version != expected_version:
+            # Another writer got in between; drop the copy so the next read reloads
+            self.evict(session_id)
+            return
+        if session_id in self._entries:
+            self._put(session_id, memory)
+
+    def _put(self, session_id: str, memory: AgentMemory) -> None:
+        now = time.monotonic()
+        old = self._entries.pop(session_id, None)
+        if old:
+            self._bytes -= old.size
+        entry = _MemoryCacheEntry(memory, self._estimate_size(memory), now, now)
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        while self._bytes > self.config.memory_cache_max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self.evict(oldest)
+
+    def evict(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry:
+            self._bytes -= entry.size
+            self.stats["evictions"] += 1
+
+    def take_all(self) -> List[AgentMemory]:
+        """Empty the cache, returning the resident memories"""
+        memories = [entry.memory for entry in self._entries.values()]
+        self._entries.clear()
+        self._bytes = 0
+        return memories
+
+    def report(self) -> Dict[str, Any]:
+        """Cache statistics including per-tier hit ratios"""
+        l1 = self.stats["l1_hits"]
+        l2 = self.stats["l2_revalidations"]
+        loads = self.stats["l2_loads"]
+        total = max(l1 + l2 + loads, 1)
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.config.memory_cache_max_bytes,
+            "l1_hit_ratio": round(l1 / total, 4),
+            "l2_hit_ratio": round(l2 / total, 4),
+            "miss_ratio": round(loads / total, 4),
+        }
+
+def embed_texts(texts: List[str], dim: int) -> "np.ndarray":
+    """L2-normalised hashed bag-of-words embeddings, one row per text"""
+    rows: List[int] = []
+    cols: List[int] = []
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            if token not in STOPWORDS:
+                rows.append(row)
+                cols.append(zlib.crc32(token.encode()) % dim)
+    embeddings = np.zeros((len(texts), dim), dtype=np.float32)
+    np.add.at(embeddings, (rows, cols), 1.0)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+class MinHashDeduplicator:
+    """Collapse near-duplicate sources using MinHash signatures and LSH
+
+    Each source is reduced to word shingles, hashed, and summarised by a
+    ``permutations``-long MinHash signature computed with NumPy. LSH
+    banding proposes candidate pairs, whose estimated Jaccard similarity
+    is then checked against ``threshold``. Near-duplicates are merged into
+    the longest member, with weights combined as 1 - prod(1 - w).
+    """
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold: float, permutations: int, bands: int, shingle_size: int, seed: int = 1):
+        if permutations % bands:
+            raise ValueError("minhash_permutations must be divisible by minhash_bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, size=permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=permutations, dtype=np.uint64)
+
+    def signature(self, text: str) -> "Optional[np.ndarray]":
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        size = min(self.shingle_size, len(tokens))
+        shingles = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % self._PRIME).min(axis=1)
+
+    def deduplicate(
+        self, sources: List[Dict[str, Any]], cancel_token: Optional[threading.Event] = None
+    ) -> List[Dict[str, Any]]:
+        signatures = []
+        for source in sources:
+            check_cancelled(cancel_token, "source deduplication")
+            signatures.append(self.signature(source.get("content", "")))
+        parent = list(range(len(sources)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        for index, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            for band in range(self.bands):
+                chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+                buckets.setdefault((band, chunk), []).append(index)
+
+        checked = set()
+        for members in buckets.values():
+            check_cancelled(cancel_token, "source deduplication")
+            for position, i in enumerate(members):
+                for j in members[position + 1:]:
+                    if (i, j) in checked:
+                        continue
+                    checked.add((i, j))
+                    if find(i) != find(j) and float((signatures[i] == signatures[j]).mean()) >= self.threshold:
+                        parent[find(j)] = find(i)
+
+        groups: Dict[int, List[int]] = {}
+        for index in range(len(sources)):
+            groups.setdefault(find(index), []).append(index)
+
+        merged = []
+        for members in groups.values():
+            keep = max(members, key=lambda i: len(sources[i].get("content", "")))
+            miss = 1.0
+            for i in members:
+                miss *= 1.0 - float(sources[i].get("weight", 1.0))
+            merged.append({**sources[keep], "weight": round(1.0 - miss, 4), "merged_from": len(members)})
+        return merged
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+class ExtractiveCompressor:
+    """Sentence-level TextRank compression of sources to a token budget
+
+    Sentences from all sources form one similarity graph (cosine over
+    hashed embeddings, computed as a single matrix product). PageRank is
+    run by power iteration with a personalization vector built from each
+    source's weight and the sentence's similarity to the goal. The best
+    sentences are kept until the budget is filled and returned in their
+    original order; a sentence larger than the whole budget is cut to
+    the budget left rather than skipped.
+    """
+
+    def __init__(self, dim: int, damping: float = 0.85, iterations: int = 30):
+        self.dim = dim
+        self.damping = damping
+        self.iterations = iterations
+
+    def compress(
+        self,
+        sources: List[Dict[str, Any]],
+        goal: str,
+        budget: int,
+        max_sentences: int,
+        cancel_token: Optional[threading.Event] = None,
+    ) -> List[Dict[str, Any]]:
+        if sum(estimate_tokens(source.get("content", "")) for source in sources) <= budget:
+            return sources
+
+        sentences: List[str] = []
+        owners: List[int] = []
+        for index, source in enumerate(sources):
+            check_cancelled(cancel_token, "source compression")
+            for sentence in _SENTENCE_RE.split(source.get("content", "")):
+                sentence = sentence.strip()
+                if sentence:
+                    sentences.append(sentence)
+                    owners.append(index)
+        if not sentences:
+            return sources
+
+        embeddings = embed_texts(sentences, self.dim)
+        weights = np.array([float(sources[owner].get("weight", 1.0)) for owner in owners])
+        relevance = embeddings @ embed_texts([goal], self.dim)[0]
+        personalization = weights * (0.5 + relevance) + 1e-6
+
+        candidates = np.arange(len(sentences))
+        if len(candidates) > max_sentences:
+            candidates = np.sort(np.argpartition(-personalization, max_sentences - 1)[:max_sentences])
+        check_cancelled(cancel_token, "source compression")
+        scores = self._textrank(embeddings[candidates], personalization[candidates], cancel_token)
+
+        keep: List[int] = []
+        used = 0
+        for position in np.argsort(-scores):
+            sentence_index = int(candidates[position])
+            cost = estimate_tokens(sentences[sentence_index])
+            if used + cost > budget:
+                if cost <= budget or used >= budget:
+                    continue
+                # Larger than the whole budget (code, JSON, CSV without sentence
+                # breaks): keep its head rather than dropping the source entirely
+                sentences[sentence_index] = sentences[sentence_index][:(budget - used) * 4]
+                cost = budget - used
+            keep.append(sentence_index)
+            used += cost
+
+        selected: Dict[int, List[str]] = {}
+        for sentence_index in sorted(keep):
+            selected.setdefault(owners[sentence_index], []).append(sentences[sentence_index])
+        return [
+            {
+                **source,
+                "content": " ".join(selected[index]),
+                "original_chars": len(source.get("content", "")),
+            }
+            for index, source in enumerate(sources) if index in selected
+        ]
+
+    def _textrank(
+        self, embeddings: "np.ndarray", personalization: "np.ndarray", cancel_token: Optional[threading.Event] = None
+    ) -> "np.ndarray":
+        similarity = np.clip(embeddings @ embeddings.T, 0.0, None)
+        np.fill_diagonal(similarity, 0.0)
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        transition = np.divide(similarity, row_sums, out=np.zeros_like(similarity), where=row_sums > 0)
+        teleport = personalization / personalization.sum()
+        dangling = row_sums[:, 0] == 0
+        scores = teleport.copy()
+        for _ in range(self.iterations):
+            check_cancelled(cancel_token, "source compression")
+            spread = scores @ transition + scores[dangling].sum() * teleport
+            scores = (1 - self.damping) * teleport + self.damping * spread
+        return scores
+
+class StreamingSentenceSelector:
+    """Keep the best sentences of a streamed document in bounded memory
+
+    Text arrives in chunks; complete sentences are scored as they appear
+    (source weight times relevance to the goal, as in ExtractiveCompressor)
+    and only the top ``capacity`` are retained in a heap, so memory stays
+    flat however long the document is. Text without sentence breaks is
+    cut every ``max_sentence_chars``, which bounds both the unfinished
+    tail carried between chunks and every retained sentence.
+    """
+
+    def __init__(self, goal_embedding: "np.ndarray", dim: int, capacity: int, weight: float, max_sentence_chars: int):
+        self.goal_embedding = goal_embedding
+        self.dim = dim
+        self.capacity = capacity
+        self.weight = weight
+        self.max_sentence_chars = max_sentence_chars
+        self._heap: List[Tuple[float, int, str]] = []
+        self._carry = ""
+        self._sequence = 0
+        self.chars_read = 0
+
+    def feed(self, chunk: str) -> None:
+        self.chars_read += len(chunk)
+        parts = _SENTENCE_RE.split(self._carry + chunk)
+        carry = parts.pop()
+        limit = self.max_sentence_chars
+        # Keep only the last, partial piece of an overlong tail
+        split_at = (len(carry) - 1) // limit * limit if carry else 0
+        parts.append(carry[:split_at])
+        self._carry = carry[split_at:]
+        sentences = []
+        for part in parts:
+            for start in range(0, len(part), limit):
+                piece = part[start:start + limit].strip()
+                if piece:
+                    sentences.append(piece)
+        self._push(sentences)
+
+    def finish(self) -> str:
+        if self._carry.strip():
+            self._push([self._carry.strip()])
+        self._carry = ""
+        kept = sorted(self._heap, key=lambda item: item[1])
+        return " ".join(sentence for _, _, sentence in kept)
+
+    def _push(self, sentences: List[str]) -> None:
+        if not sentences:
+            return
+        scores = self.weight * (0.5 + embed_texts(sentences, self.dim) @ self.goal_embedding)
+        for score, sentence in zip(scores.tolist(), sentences):
+            item = (score, self._sequence, sentence)
+            self._sequence += 1
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, item)
+            elif score > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+class KnowledgeIndex:
+    """In-process retrieval index over the knowledge-base sections
+
+    Section embeddings are computed once at load; a query is one
+    matrix-vector product plus an optional per-section score bias.
+    """
+
+    def __init__(self, sections: List[Dict[str, Any]], dim: int):
+        self.sections = sections
+        self.dim = dim
+        self.section_ids = [section["id"] for section in sections]
+        self.version = zlib.crc32(json.dumps(sections, sort_keys=True).encode())
+        self.embeddings = embed_texts([
+            " ".join([section.get("title", ""), " ".join(section.get("tags", [])), section.get("content", "")])
+            for section in sections
+        ], dim)
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def share_memory(self) -> None:
+        """Move the embeddings into a read-only shared anonymous mapping
+
+        Called before forking workers so they all read one physical copy,
+        which no write in any process can unshare.
+        """
+        buffer = mmap.mmap(-1, max(self.embeddings.nbytes, 1))
+        shared = np.frombuffer(buffer, dtype=self.embeddings.dtype, count=self.embeddings.size)
+        shared = shared.reshape(self.embeddings.shape)
+        shared[...] = self.embeddings
+        shared.flags.writeable = False
+        self.embeddings = shared
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "KnowledgeIndex":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                sections = json.load(f).get("sections", [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Knowledge base unavailable at {path}: {e}")
+            sections = []
+        return cls(sections, dim)
+
+    def search(self, query: str, top_k: int, bias: "Optional[np.ndarray]" = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Top-k sections by cosine similarity plus bias, best first"""
+        if not self.sections or top_k <= 0:
+            return []
+        scores = self.embeddings @ embed_texts([query], self.dim)[0]
+        if bias is not None:
+            scores = scores + bias
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.sections[i], float(scores[i])) for i in top]
+
+class SectionPriors:
+    """Feedback-derived score bias per knowledge-base section
+
+    Each section keeps Beta(helpful + 1, unhelpful + 1) counts; its bias is
+    ``strength * (posterior mean - 0.5)``, so unrated sections are neutral
+    and the bias vector is added to retrieval scores in one operation.
+
+    The counts are shared through the ``dt:kb:priors`` hash; every write
+    also bumps ``revision`` in ``dt:kb:priors:meta``, so a worker reloads
+    the hash only when another one has changed it.
+    """
+
+    REDIS_KEY = "dt:kb:priors"
+    META_KEY = "dt:kb:priors:meta"
+
+    def __init__(self, section_ids: List[str], strength: float):
+        self.position = {section_id: index for index, section_id in enumerate(section_ids)}
+        self.strength = strength
+        self.helpful = np.ones(len(section_ids))
+        self.unhelpful = np.ones(len(section_ids))
+        self.bias = np.zeros(len(section_ids))
+        self.revision = 0  # bumped whenever the bias vector changes
+        self.shared_revision = 0  # dt:kb:priors:meta revision the counts reflect
+
+    def fields(self, ratings: Dict[str, Tuple[int, int]]) -> Dict[str, int]:
+        """Redis HINCRBY fields for (helpful, unhelpful) increments of known sections"""
+        increments: Dict[str, int] = {}
+        for section_id, (helpful, unhelpful) in ratings.items():
+            if section_id not in self.position:
+                continue
+            if helpful:
+                increments[f"{section_id}:helpful"] = helpful
+            if unhelpful:
+                increments[f"{section_id}:unhelpful"] = unhelpful
+        return increments
+
+    def update(self, ratings: Dict[str, Tuple[int, int]]) -> None:
+        """Apply (helpful, unhelpful) increments"""
+        touched = []
+        for section_id, (helpful, unhelpful) in ratings.items():
+            index = self.position.get(section_id)
+            if index is None:
+                continue
+            self.helpful[index] += helpful
+            self.unhelpful[index] += unhelpful
+            touched.append(index)
+        if touched:
+            self._recompute(np.asarray(touched))
+            self.revision += 1
+
+    def increments(self) -> Dict[str, int]:
+        """All ratings folded in so far, as Redis HINCRBY fields"""
+        fields: Dict[str, int] = {}
+        for section_id, index in self.position.items():
+            for kind in ("helpful", "unhelpful"):
+                count = int(getattr(self, kind)[index]) - 1
+                if count:
+                    fields[f"{section_id}:{kind}"] = count
+        return fields
+
+    def load(self, raw: Dict[str, str], shared_revision: int) -> None:
+        """Replace the counts with the Redis hash as of shared_revision"""
+        for field, value in (raw or {}).items():
+            section_id, _, kind = field.rpartition(":")
+            index = self.position.get(section_id)
+            if index is not None and kind in ("helpful", "unhelpful"):
+                getattr(self, kind)[index] = 1 + int(value)
+        self._recompute(np.arange(len(self.position)))
+        self.revision += 1
+        self.shared_revision = shared_revision
+
+    def _recompute(self, indices: "np.ndarray") -> None:
+        mean = self.helpful[indices] / (self.helpful[indices] + self.unhelpful[indices])
+        self.bias[indices] = self.strength * (mean - 0.5)
+
+class TopicClusterer:
+    """Incremental mini-batch k-means over question embeddings
+
+    New questions are buffered by ``add`` and folded into the centroids a
+    batch at a time in ``executor``, so the event loop never does the
+    linear algebra. A fold starts in the background as soon as
+    ``refresh_after`` questions are pending, so the buffer stays small
+    whether or not anyone asks for the clusters; if folds fall behind, at
+    most ``max_pending`` questions wait and the oldest are dropped. The
+    cluster summary is cached and refreshed by each fold. Folds serve
+    every later caller rather than one request, so they only stop early
+    when ``cancel_token`` (the server's shutdown token) is set.
+    """
+
+    FOLD_CHUNK = 256  # questions per mini-batch step, and per cancellation check
+
+    def __init__(
+        self,
+        n_clusters: int,
+        dim: int,
+        refresh_after: int,
+        max_pending: int,
+        executor: Executor,
+        cancel_token: Optional[threading.Event] = None,
+    ):
+        self.n_clusters = n_clusters
+        self.dim = dim
+        self.refresh_after = refresh_after
+        self.executor = executor
+        self.cancel_token = cancel_token
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.float64)
+        self.term_counts: List[Dict[str, int]] = []
+        self.pending: Deque[str] = deque(maxlen=max_pending)
+        self.seen = 0
+        self.dropped = 0
+        self._summary: Optional[Dict[str, Any]] = None
+        self._fitting: Optional[asyncio.Future] = None
+        self._lock = asyncio.Lock()
+
+    def add(self, text: str) -> None:
+        if not text:
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(text)
+        if self._fitting is None and len(self.pending) >= self.refresh_after:
+            self._start_fit()
+
+    async def summarize(self) -> Dict[str, Any]:
+        """Return the clusters, waiting for a running fold or folding in a first batch"""
+        async with self._lock:
+            if self._fitting is None and self.pending and (
+                self._summary is None or len(self.pending) >= self.refresh_after
+            ):
+                self._start_fit()
+            # A fold already running (started by add, or abandoned by an
+            # expired request) is awaited rather than run concurrently
+            if self._fitting is not None:
+                await current_request().run(asyncio.shield(self._fitting), "topic clustering")
+            return self._summary or {"clusters": [], "interactions": 0}
+
+    def _start_fit(self) -> None:
+        batch = list(self.pending)
+        self.pending.clear()
+        try:
+            self._fitting = asyncio.get_running_loop().run_in_executor(self.executor, self._fit_and_summarize, batch)
+        except RuntimeError:  # executor shut down
+            return
+        self._fitting.add_done_callback(self._fit_done)
+
+    def _fit_done(self, future: asyncio.Future) -> None:
+        self._fitting = None
+        if not future.cancelled() and future.exception() is None:
+            self._summary = future.result()
+        if len(self.pending) >= self.refresh_after:
+            self._start_fit()
+
+    def _fit_and_summarize(self, texts: List[str]) -> Dict[str, Any]:
+        for start in range(0, len(texts), self.FOLD_CHUNK):
+            check_cancelled(self.cancel_token, "topic clustering")
+            self.partial_fit(texts[start:start + self.FOLD_CHUNK])
+        return self.summary()
+
+    def _grow(self, embeddings: "np.ndarray") -> None:
+        """Seed missing centroids k-means++ style from the farthest points"""
+        while len(self.centroids) < self.n_clusters:
+            if len(self.centroids):
+                distances = self._distances(embeddings).min(axis=1)
+                candidate = int(distances.argmax())
+                if distances[candidate] <= 1e-6:
+                    return
+            else:
+                candidate = 0
+            self.centroids = np.vstack([self.centroids, embeddings[candidate]])
+            self.counts = np.append(self.counts, 0.0)
+            self.term_counts.append({})
+
+    def _distances(self, embeddings: "np.ndarray") -> "np.ndarray":
+        """Squared euclidean distances, shape (n_texts, n_centroids)"""
+        return (
+            (embeddings ** 2).sum(axis=1)[:, None]
+            - 2.0 * embeddings @ self.centroids.T
+            + (self.centroids ** 2).sum(axis=1)[None, :]
+        )
+
+    def partial_fit(self, texts: List[str]) -> "np.ndarray":
+        """One mini-batch step; returns the cluster label of each text"""
+        embeddings = embed_texts(texts, self.dim)
+        self._grow(embeddings)
+        labels = self._distances(embeddings).argmin(axis=1)
+
+        k = len(self.centroids)
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, labels, embeddings)
+        self.counts += batch_counts
+        updated = batch_counts > 0
+        # Per-centre learning rate 1/count, applied to the batch mean
+        self.centroids[updated] += (
+            sums[updated] - batch_counts[updated, None] * self.centroids[updated]
+        ) / self.counts[updated, None]
+
+        for text, label in zip(texts, labels):
+            terms = self.term_counts[label]
+            for token in tokenize(text):
+                if token not in STOPWORDS and len(token) > 2:
+                    terms[token] = terms.get(token, 0) + 1
+        self.seen += len(texts)
+        return labels
+
+    def summary(self, top_terms: int = 3) -> Dict[str, Any]:
+        total = self.counts.sum()
+        clusters = []
+        for index in np.argsort(-self.counts):
+            if not self.counts[index]:
+                continue
+            terms = sorted(self.term_counts[index].items(), key=lambda kv: kv[1], reverse=True)[:top_terms]
+            clusters.append({
+                "label": " / ".join(term for term, _ in terms) or "misc",
+                "size": int(self.counts[index]),
+                "share": round(float(self.counts[index] / total), 3),
+            })
+        return {"clusters": clusters, "interactions": self.seen}
+
+@dataclass
+class _MaterializedAnalysis:
+    version: Tuple[int, int]
+    text: str
+    last_hit: float = 0.0
+    hits: int = 0
+
+class MaterializedAnalysisCache:
+    """Serialized memory_analysis results keyed by (type, session, range)
+
+    An entry is valid while its version matches the caller's; the version
+    combines the session's write stamp with the current time bucket for
+    sliding ranges. Keys polled recently are reported as hot so a
+    background task can refresh them before the next poll.
+    """
+
+    def __init__(self, max_entries: int, hot_window: float):
+        self.max_entries = max_entries
+        self.hot_window = hot_window
+        self._entries: "OrderedDict[Tuple[str, Optional[str], str], _MaterializedAnalysis]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, Optional[str], str], version: Tuple[int, int]) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.last_hit = time.monotonic()
+        entry.hits += 1
+        if entry.version != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.text
+
+    def put(self, key: Tuple[str, Optional[str], str], version: Tuple[int, int], text: str) -> None:
+        entry = self._entries.pop(key, None)
+        self._entries[key] = _MaterializedAnalysis(
+            version, text,
+            last_hit=entry.last_hit if entry else time.monotonic(),
+            hits=entry.hits if entry else 0
+        )
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def hot_keys(self) -> List[Tuple[Tuple[str, Optional[str], str], Tuple[int, int]]]:
+        """Recently polled keys with the version they were computed at"""
+        cutoff = time.monotonic() - self.hot_window
+        return [(key, entry.version) for key, entry in self._entries.items() if entry.last_hit >= cutoff]
+
+class FeedbackIngestQueue:
+    """Bounded async queue between adaptive_learning and the learning store
+
+    Handlers only enqueue. A single consumer collects events into batches
+    of up to ``batch_size`` or ``flush_interval`` seconds, whichever comes
+    first, and hands each batch to ``apply_batch``. A batch stays in hand
+    until it has been applied; failures are retried with exponential
+    backoff, and only a batch that fails ``feedback_max_attempts`` times
+    is dropped (and counted as failed). ``close`` stops intake and flushes
+    everything still queued or in hand, including a batch whose apply was
+    interrupted, so delivery is at-least-once.
+    """
+
+    def __init__(self, apply_batch, config: ServerConfig):
+        self._apply_batch = apply_batch
+        self.config = config
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=config.feedback_queue_size)
+        self._in_hand: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.accepting = True
+        self.stats = {"enqueued": 0, "rejected": 0, "flushed": 0, "batches": 0, "retries": 0, "failed": 0}
+
+    def __len__(self) -> int:
+        return self._queue.qsize() + len(self._in_hand)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._consume())
+
+    async def submit(self, event: Dict[str, Any]) -> bool:
+        """Enqueue an event; False if intake is closed or the queue stays full"""
+        if not self.accepting:
+            self.stats["rejected"] += 1
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(event), self.config.feedback_enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected"] += 1
+                return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._in_hand = [await self._queue.get()]
+            deadline = loop.time() + self.config.feedback_flush_interval
+            while len(self._in_hand) < self.config.feedback_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._in_hand.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            attempts = 1
+            while not await self._flush(self._in_hand):
+                if attempts >= self.config.feedback_max_attempts:
+                    self._drop(self._in_hand)
+                    break
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.config.feedback_retry_delay * 2 ** (attempts - 1))
+                attempts += 1
+            self._in_hand = []
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        """Apply a batch; True once applied, False (batch untouched) on failure"""
+        try:
+            await self._apply_batch(batch)
+        except Exception as e:
+            logger.error(f"❌ Feedback batch of {len(batch)} failed: {e}")
+            return False
+        self.stats["flushed"] += len(batch)
+        self.stats["batches"] += 1
+        for _ in batch:
+            self._queue.task_done()
+        return True
+
+    def _drop(self, batch: List[Dict[str, Any]]) -> None:
+        self.stats["failed"] += len(batch)
+        logger.error(
+            f"❌ Dropped {len(batch)} feedback events after repeated failures: "
+            f"{[event.get('event_id') for event in batch]}"
+        )
+        for _ in batch:
+            self._queue.task_done()
+
+    async def close(self) -> None:
+        """Stop intake, then flush queued and in-hand events"""
+        self.accepting = False
+        if self._task:
+            try:
+                await asyncio.wait_for(self._queue.join(), self.config.feedback_drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ Feedback drain timed out; flushing remaining events directly")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Includes a batch whose apply was interrupted by the cancellation above
+        leftover, self._in_hand = self._in_hand, []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover and not await self._flush(leftover):
+            self._drop(leftover)
+
+class ToolResultError(Exception):
+    """A tool result marked isError, raised so memos and caches do not keep it"""
+
+    def __init__(self, result: CallResult):
+        super().__init__("\n".join(getattr(item, "text", "") for item in result.content))
+        self.result = result
+
+class OrchestrationStep(BaseModel):
+    """A node in an orchestration plan: one MCP tool call"""
+    step_id: str
+    tool: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+    depends_on: List[str] = Field(default_factory=list)
+    # param name -> step ids whose outputs are passed in as synthesis sources
+    inputs: Dict[str, List[str]] = Field(default_factory=dict)
+
+class StepResultMemo:
+    """TTL + LRU memo of orchestration step outputs shared across runs
+
+    Keys are (tool, canonicalized params, state version) digests, where the
+    state version covers whatever live state the output depends on.
+    Only free-text parameters are case- and whitespace-normalized;
+    identifiers such as session ids are kept exact. Concurrent requests
+    for a key that is still being computed await the same future instead
+    of executing the step twice. Failures are never memoized; callers
+    raise for tool results marked ``isError`` so those are not kept either.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    FREE_TEXT_PARAMS = frozenset({"question", "goal", "synthesis_goal"})
+
+    @classmethod
+    def _canonical(cls, value: Any, free_text: bool = False) -> Any:
+        if isinstance(value, str):
+            return " ".join(value.lower().split()) if free_text else value
+        if isinstance(value, dict):
+            return {k: cls._canonical(v, k in cls.FREE_TEXT_PARAMS) for k, v in value.items() if v is not None}
+        if isinstance(value, (list, tuple)):
+            return [cls._canonical(v) for v in value]
+        return value
+
+    @classmethod
+    def make_key(cls, tool: str, params: Dict[str, Any], state_version: Any) -> str:
+        payload = json.dumps([tool, cls._canonical(params), state_version], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    async def get_or_compute(self, key: str, compute) -> Tuple[str, bool]:
+        """Return (value, cache_hit)"""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], True
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            try:
+                value = await asyncio.shield(pending)
+                self.hits += 1
+                return value, True
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The owning request was cancelled; compute it ourselves
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(value)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value, False
+        finally:
+            # A waiter that fell through above may have installed its own future since
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+class OrchestrationDAG:
+    """Runs a plan as a dependency graph
+
+    Every step waits only on its own dependencies, so independent steps
+    run concurrently (bounded by ``max_concurrency``), each under its own
+    timeout. Steps whose dependencies failed are skipped. The report
+    carries the critical path, i.e. the dependency chain that determined
+    wall time. ``execute`` returns a dict merged into the step record,
+    which must contain at least ``result``, and raises for a failed step
+    (a tool result marked ``isError`` included), which is recorded as
+    ``error`` and skips its dependents.
+    """
+
+    def __init__(self, steps: List[OrchestrationStep], max_concurrency: int, step_timeout: float):
+        self.steps = {step.step_id: step for step in steps}
+        self.order = self._topological_order(steps)
+        self.max_concurrency = max_concurrency
+        self.step_timeout = step_timeout
+
+    @staticmethod
+    def _topological_order(steps: List[OrchestrationStep]) -> List[str]:
+        pending = {step.step_id: set(step.depends_on) for step in steps}
+        unknown = {dep for deps in pending.values() for dep in deps} - pending.keys()
+        if unknown:
+            raise ValueError(f"Unknown orchestration dependencies: {sorted(unknown)}")
+        order: List[str] = []
+        ready = [step_id for step_id, deps in pending.items() if not deps]
+        while ready:
+            step_id = ready.pop(0)
+            order.append(step_id)
+            for other, deps in pending.items():
+                if step_id in deps:
+                    deps.discard(step_id)
+                    if not deps and other not in order and other not in ready:
+                        ready.append(other)
+        if len(order) != len(pending):
+            raise ValueError("Orchestration plan contains a cycle")
+        return order
+
+    async def run(self, execute) -> Dict[str, Any]:
+        """Run every step via ``execute(step, dependency_results)``"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: Dict[str, Dict[str, Any]] = {}
+        done: Dict[str, asyncio.Event] = {step_id: asyncio.Event() for step_id in self.steps}
+        started = time.perf_counter()
+
+        async def run_step(step: OrchestrationStep) -> None:
+            for dep in step.depends_on:
+                await done[dep].wait()
+            dep_results = {dep: results[dep] for dep in step.depends_on}
+            record = {"step_id": step.step_id, "tool": step.tool}
+            try:
+                if any(result["status"] != "ok" for result in dep_results.values()):
+                    record.update(status="skipped", result="A dependency did not complete")
+                    record.update(started_ms=0.0, finished_ms=0.0, duration_ms=0.0)
+                    return
+                async with semaphore:
+                    begin = time.perf_counter()
+                    try:
+                        output = await asyncio.wait_for(execute(step, dep_results), self.step_timeout)
+                        record.update(status="ok", **output)
+                    except asyncio.TimeoutError:
+                        record.update(status="timeout", result=f"Timed out after {self.step_timeout}s")
+                    except Exception as e:
+                        record.update(status="error", result=str(e))
+                    end = time.perf_counter()
+                record.update(
+                    started_ms=round((begin - started) * 1000, 2),
+                    finished_ms=round((end - started) * 1000, 2),
+                    duration_ms=round((end - begin) * 1000, 2),
+                )
+            finally:
+                results[step.step_id] = record
+                done[step.step_id].set()
+
+        await asyncio.gather(*(run_step(self.steps[step_id]) for step_id in self.order))
+        wall_ms = round((time.perf_counter() - started) * 1000, 2)
+        ordered = [results[step_id] for step_id in self.order]
+        return {
+            "steps": ordered,
+            "wall_ms": wall_ms,
+            "sequential_ms": round(sum(result["duration_ms"] for result in ordered), 2),
+            **self._critical_path(results),
+        }
+
+    def _critical_path(self, results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        finish: Dict[str, float] = {}
+        via: Dict[str, Optional[str]] = {}
+        for step_id in self.order:
+            deps = self.steps[step_id].depends_on
+            previous = max(deps, key=lambda dep: finish[dep], default=None)
+            finish[step_id] = results[step_id]["duration_ms"] + (finish[previous] if previous else 0.0)
+            via[step_id] = previous
+        if not finish:
+            return {"critical_path": [], "critical_path_ms": 0.0}
+        tail: Optional[str] = max(finish, key=finish.get)
+        path = []
+        length = finish[tail]
+        while tail:
+            path.append(tail)
+            tail = via[tail]
+        return {"critical_path": path[::-1], "critical_path_ms": round(length, 2)}
+
+class JsonSerializer:
+    """JSON encoder for resource contents and tool results
+
+    ``pretty`` gives indented output for people reading it; compact output
+    drops all insignificant whitespace for machine clients. orjson is used
+    when installed, with the standard library as fallback (and for values
+    orjson rejects, such as integers wider than 64 bits). datetimes,
+    pydantic models, dataclasses, sets and NumPy values are encoded
+    natively rather than through ``str``.
+    """
+
+    def __init__(self, pretty: bool = False):
+        self.pretty = pretty
+        if orjson is not None:
+            self._orjson_options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            if pretty:
+                self._orjson_options |= orjson.OPT_INDENT_2
+        self._encoder = json.JSONEncoder(
+            default=self._default,
+            ensure_ascii=False,
+            indent=2 if pretty else None,
+            separators=None if pretty else (",", ":"),
+        )
+
+    @staticmethod
+    def _default(value: Any) -> Any:
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, BaseModel):
+            return value.model_dump(mode="json")
+        if is_dataclass(value):
+            return asdict(value)
+        if isinstance(value, (set, frozenset, deque)):
+            return list(value)
+        if hasattr(value, "tolist"):  # NumPy arrays and scalars
+            return value.tolist()
+        return str(value)
+
+    def dumps(self, value: Any) -> str:
+        if orjson is not None:
+            try:
+                return orjson.dumps(value, default=self._default, option=self._orjson_options).decode()
+            except TypeError:
+                pass
+        return self._encoder.encode(value)
+
+    def iter_encode(self, value: Any, chunk_size: int = 64 * 1024) -> Iterator[str]:
+        """Encode incrementally, yielding chunks of roughly chunk_size characters"""
+        buffer: List[str] = []
+        buffered = 0
+        for piece in self._encoder.iterencode(value):
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= chunk_size:
+                yield "".join(buffer)
+                buffer.clear()
+                buffered = 0
+        if buffer:
+            yield "".join(buffer)
+
+def build_tool_definitions() -> List[Tool]:
+    """Descriptors for every tool the server exposes"""
+    return [
+        Tool(
+            name="advanced_query",
+            description="Advanced query with multi-step reasoning and context awareness",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "question": {
+                        "type": "string",
+                        "description": "The question to process with advanced reasoning"
+                    },
+                    "reasoning_mode": {
+                        "type": "string",
+                        "enum": ["simple", "analytical", "creative", "strategic"],
+                        "description": "The reasoning approach to use",
+                        "default": "analytical"
+                    },
+                    "context_depth": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": 10,
+                        "description": "Depth of context to consider",
+                        "default": 5
+                    },
+                    "include_reasoning_steps": {
+                        "type": "boolean",
+                        "description": "Whether to include reasoning steps in response",
+                        "default": False
+                    },
+                    "session_id": {
+                        "type": "string",
+                        "description": "Session ID used to record the interaction in memory"
+                    }
+                },
+                "required": ["question"]
+            }
+        ),
+
+        Tool(
+            name="memory_analysis",
+            description="Analyze and extract insights from conversation memory",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "analysis_type": {
+                        "type": "string",
+                        "enum": ["user_profile", "preferences", "patterns", "sentiment", "topics"],
+                        "description": "Type of memory analysis to perform"
+                    },
+                    "session_id": {
+                        "type": "string",
+                        "description": "Session ID to analyze"
+                    },
+                    "time_range": {
+                        "type": "string",
+                        "enum": ["last_hour", "last_day", "last_week", "all_time"],
+                        "description": "Time range for analysis",
+                        "default": "all_time"
+                    }
+                },
+                "required": ["analysis_type"]
+            }
+        ),
+
+        Tool(
+            name="tool_orchestration",
+            description="Orchestrate multiple tools to solve complex problems",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "goal": {
+                        "type": "string",
+                        "description": "The high-level goal to achieve"
+                    },
+                    "available_tools": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of available tools to orchestrate"
+                    },
+                    "constraints": {
+                        "type": "object",
+                        "description": "Constraints and preferences for orchestration"
+                    },
+                    "max_steps": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": 20,
+                        "description": "Maximum number of orchestration steps",
+                        "default": 10
+                    }
+                },
+                "required": ["goal"]
+            }
+        ),
+
+        Tool(
+            name="context_synthesis",
+            description="Synthesize information from multiple sources with advanced reasoning",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "sources": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "type": {"type": "string"},
+                                "content": {"type": "string"},
+                                "uri": {
+                                    "type": "string",
+                                    "description": "Reference read instead of inline content: a file path or file:// URI under the configured source roots (relative paths are looked up in each root), memory://agent-memory or memory://session/{session_id} for the calling session"
+                                },
+                                "weight": {"type": "number", "minimum": 0, "maximum": 1}
+                            }
+                        },
+                        "description": "Information sources to synthesize"
+                    },
+                    "synthesis_goal": {
+                        "type": "string",
+                        "description": "Goal of the synthesis process"
+                    },
+                    "session_id": {
+                        "type": "string",
+                        "description": "Session ID of the caller; memory://session/ sources may only reference it"
+                    },
+                    "output_format": {
+                        "type": "string",
+                        "enum": ["summary", "analysis", "recommendations", "insights"],
+                        "description": "Desired output format",
+                        "default": "analysis"
+                    }
+                },
+                "required": ["sources", "synthesis_goal"]
+            }
+        ),
+
+        Tool(
+            name="adaptive_learning",
+            description="Learn and adapt from interactions to improve responses",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "interaction_data": {
+                        "type": "object",
+                        "description": "Data from recent interactions"
+                    },
+                    "learning_focus": {
+                        "type": "string",
+                        "enum": ["user_preferences", "communication_style", "topic_expertise", "response_quality"],
+                        "description": "Focus area for learning"
+                    },
+                    "feedback": {
+                        "type": "object",
+                        "description": "User feedback on responses; set helpful (bool) with sections, or section_ratings ({section_id: bool}), to tune retrieval"
+                    }
+                },
+                "required": ["interaction_data", "learning_focus"]
+            }
+        ),
+
+        Tool(
+            name="performance_analytics",
+            description="Analyze server performance and usage patterns",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "metric_type": {
+                        "type": "string",
+                        "enum": ["response_time", "tool_usage", "error_rates", "user_satisfaction", "memory_usage"],
+                        "description": "Type of performance metric to analyze"
+                    },
+                    "time_period": {
+                        "type": "string",
+                        "enum": ["last_hour", "last_day", "last_week", "last_month"],
+                        "description": "Time period for analysis",
+                        "default": "last_day"
+                    },
+                    "aggregation": {
+                        "type": "string",
+                        "enum": ["average", "median", "percentiles", "distribution"],
+                        "description": "How to aggregate the data",
+                        "default": "average"
+                    }
+                },
+                "required": ["metric_type"]
+            }
+        )
+    ]
+
+# Resources clients may subscribe to instead of polling
+SUBSCRIBABLE_RESOURCES = ("memory://agent-memory", "analytics://performance-metrics", "reasoning://chains")
+
+def build_resource_definitions() -> List[Resource]:
+    """Descriptors for every resource the server exposes"""
+    return [
+        Resource(
+            uri="memory://agent-memory",
+            name="Agent Memory System",
+            description="Access to persistent agent memory and learning"
+        ),
+        Resource(
+            uri="analytics://performance-metrics",
+            name="Performance Analytics",
+            description="Server performance and usage analytics"
+        ),
+        Resource(
+            uri="reasoning://chains",
+            name="Reasoning Chains",
+            description="Access to multi-step reasoning processes; "
+                        "paged with ?cursor=&limit=, filtered with ?mode=&since=&until="
+        )
+    ]
+
+class DescriptorRegistry:
+    """Immutable tool and resource descriptors, built once at startup
+
+    The list results are prebuilt objects, and the serialized form and its
+    ETag are computed up front. list_tools and list_resources therefore
+    return a stored reference, and HTTP clients can revalidate with
+    If-None-Match.
+    """
+
+    def __init__(self, tools: List[Tool], resources: List[Resource]):
+        self.tools: Tuple[Tool, ...] = tuple(tools)
+        self.resources: Tuple[Resource, ...] = tuple(resources)
+        self.tool_names = frozenset(tool.name for tool in self.tools)
+        self.serialized = json.dumps(
+            {
+                "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in self.tools],
+                "resources": [resource.model_dump(mode="json", exclude_none=True) for resource in self.resources],
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        ).encode()
+        self.etag = hashlib.sha256(self.serialized).hexdigest()[:16]
+        self.tools_result = ListToolsResult(tools=list(self.tools), _meta={"etag": self.etag})
+        self.resources_result = ListResourcesResult(resources=list(self.resources), _meta={"etag": self.etag})
+
+class SubscribableServer(Server):
+    """MCP server that advertises resource subscriptions
+
+    The SDK reports ``subscribe=False`` even when subscribe handlers are
+    registered, so clients would never subscribe.
+    """
+
+    def get_capabilities(self, notification_options, experimental_capabilities):
+        capabilities = super().get_capabilities(notification_options, experimental_capabilities)
+        if capabilities.resources is not None and SubscribeRequest in self.request_handlers:
+            capabilities.resources.subscribe = True
+        return capabilities
+
+class ResourceSubscriptions:
+    """Sessions subscribed to resources, notified of changes at a bounded rate
+
+    Writers call ``mark_changed``, which is a no-op for resources nobody
+    subscribes to. A single notifier task sends ``resources/updated`` to
+    every subscriber of each changed resource, then waits
+    ``min_interval`` before the next round, so a burst of writes is
+    coalesced into one notification per resource and session. Subscribers
+    re-read the resource instead of polling it. Sessions that fail or time
+    out on a send are unsubscribed.
+    """
+
+    def __init__(self, uris: frozenset, min_interval: float, send_timeout: float):
+        self.uris = uris
+        self.min_interval = min_interval
+        self.send_timeout = send_timeout
+        self._subscribers: Dict[str, "weakref.WeakSet"] = {uri: weakref.WeakSet() for uri in uris}
+        self._dirty: set = set()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"notifications": 0, "coalesced": 0, "dropped_sessions": 0}
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._notify_loop())
+
+    def subscribe(self, uri: str, session) -> None:
+        if uri not in self.uris:
+            raise ValueError(f"Resource does not support subscriptions: {uri}")
+        self._subscribers[uri].add(session)
+
+    def unsubscribe(self, uri: str, session) -> None:
+        subscribers = self._subscribers.get(uri)
+        if subscribers is not None:
+            subscribers.discard(session)
+
+    def mark_changed(self, uri: str) -> None:
+        if not self._subscribers.get(uri):
+            return
+        if uri in self._dirty:
+            self.stats["coalesced"] += 1
+        self._dirty.add(uri)
+        self._changed.set()
+
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats, "subscribers": {uri: len(sessions) for uri, sessions in self._subscribers.items()}}
+
+    async def _notify_loop(self) -> None:
+        while True:
+            await self._changed.wait()
+            await self._notify_changed()
+            await asyncio.sleep(self.min_interval)
+
+    async def _notify_changed(self) -> None:
+        self._changed.clear()
+        dirty, self._dirty = self._dirty, set()
+        if dirty:
+            sends = [
+                (uri, session)
+                for uri in dirty
+                for session in list(self._subscribers[uri])
+            ]
+            results = await asyncio.gather(
+                *(asyncio.wait_for(session.send_resource_updated(uri), self.send_timeout) for uri, session in sends),
+                return_exceptions=True
+            )
+            for (uri, session), result in zip(sends, results):
+                if isinstance(result, Exception):
+                    self.stats["dropped_sessions"] += 1
+                    self.unsubscribe(uri, session)
+                    logger.warning(f"⚠️ Dropped subscriber of {uri}: {result!r}")
+                else:
+                    self.stats["notifications"] += 1
+
+    async def close(self) -> None:
+        """Stop the notifier, sending any pending updates first"""
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self._notify_changed()
+
+class ConnectionLimiter:
+    """ASGI wrapper that caps concurrent HTTP connections
+
+    Open SSE streams count for as long as they stay open. Requests over
+    the cap get an immediate 503 instead of queueing behind the others.
+    """
+
+    def __init__(self, app, max_connections: int):
+        self.app = app
+        self.max_connections = max_connections
+        self.active = 0
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.active >= self.max_connections:
+            self.rejected += 1
+            body = json.dumps({"error": "Server at connection limit, retry later"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        self.active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
+
+@dataclass
+class ToolCall:
+    """State threaded through a tool's middleware pipeline"""
+    server: Any
+    name: str
+    arguments: Dict[str, Any]
+    outcome: str = "ok"
+
+Middleware = Callable[[ToolCall, Callable[[], Awaitable[CallResult]]], Awaitable[CallResult]]
+
+@dataclass(frozen=True)
+class _RegisteredTool:
+    handler: Callable[[Any, Dict[str, Any]], Awaitable[CallResult]]
+    middleware: Tuple[Middleware, ...]
+
+class ToolRegistry:
+    """Maps tool names to handlers and the middleware each one opts into
+
+    Handlers register with the ``tool`` decorator and are called as
+    ``handler(server, arguments)``. The first middleware listed is the
+    outermost.
+    """
+
+    def __init__(self):
+        self._tools: Dict[str, _RegisteredTool] = {}
+
+    def tool(self, name: str, *middleware: Middleware):
+        def decorator(func):
+            if name in self._tools:
+                raise ValueError(f"Tool {name} is already registered")
+            self._tools[name] = _RegisteredTool(func, tuple(middleware))
+            return func
+        return decorator
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    @property
+    def names(self) -> frozenset:
+        return frozenset(self._tools)
+
+    async def dispatch(self, call: ToolCall) -> CallResult:
+        entry = self._tools[call.name]
+        handler = entry.handler
+        middleware = entry.middleware
+
+        async def invoke(index: int) -> CallResult:
+            if index == len(middleware):
+                return await handler(call.server, call.arguments)
+            return await middleware[index](call, lambda: invoke(index + 1))
+
+        return await invoke(0)
+
+TOOL_REGISTRY = ToolRegistry()
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """Take a token; return 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+async def rate_limited(call: ToolCall, call_next) -> CallResult:
+    """Reject calls over the tool's configured rate instead of queueing them"""
+    server = call.server
+    rate = server.config.tool_rate_limits.get(call.name)
+    if not rate:
+        return await call_next()
+    bucket = server.rate_limiters.get(call.name)
+    if bucket is None:
+        bucket = server.rate_limiters[call.name] = TokenBucket(rate, max(1.0, rate))
+    retry_after = bucket.try_acquire()
+    if retry_after:
+        call.outcome = "rate_limited"
+        return CallResult(
+            content=[TextContent(type="text", text=f"Rate limit exceeded for {call.name}, retry in {retry_after:.2f}s")],
+            isError=True
+        )
+    return await call_next()
+
+async def timed(call: ToolCall, call_next) -> CallResult:
+    """Record the wall time of every call, whatever its outcome"""
+    started = time.perf_counter()
+    try:
+        return await call_next()
+    finally:
+        call.server.tool_latency.record(call.name, (time.perf_counter() - started) * 1000)
+
+async def with_deadline(call: ToolCall, call_next) -> CallResult:
+    """Bound the call by its deadline and expose it through ``current_request()``"""
+    config = call.server.config
+    timeout = config.tool_timeouts.get(call.name, config.tool_timeout)
+    context = RequestContext(tool=call.name, deadline=time.monotonic() + timeout)
+    context_token = _request_context.set(context)
+    try:
+        result = await context.run(call_next(), "tool call")
+        if context.timed_out:
+            call.outcome = "timeout"
+        return result
+    except DeadlineExceeded:
+        call.outcome = "timeout"
+        logger.warning(f"⏱️ Tool {call.name} exceeded its {timeout}s deadline")
+        return CallResult(
+            content=[TextContent(type="text", text=f"Tool {call.name} timed out after {timeout}s")],
+            isError=True
+        )
+    finally:
+        # Signal any worker-thread stragglers that nobody is waiting
+        context.cancel()
+        _request_context.reset(context_token)
+
+async def cached(call: ToolCall, call_next) -> CallResult:
+    """Share results of identical calls for ``tool_cache_ttl`` seconds
+
+    Only for tools without side effects whose result follows from their
+    arguments; tools reporting live state are never cached. Sources
+    referenced by ``uri`` can change behind identical arguments, so such
+    calls bypass the cache. Concurrent identical calls are coalesced into
+    one execution, and error results are not kept.
+    """
+    if any(isinstance(source, dict) and source.get("uri") for source in call.arguments.get("sources") or []):
+        return await call_next()
+
+    async def compute() -> CallResult:
+        result = await call_next()
+        if result.isError:
+            raise ToolResultError(result)
+        return result
+
+    key = StepResultMemo.make_key(call.name, call.arguments, None)
+    try:
+        result, _ = await call.server.tool_cache.get_or_compute(key, compute)
+    except ToolResultError as e:
+        return e.result
+    return result
 
 class AdvancedDigitalTwinServer:
     """Advanced Digital Twin MCP Server with enhanced AI capabilities"""
     
     def __init__(self, config: ServerConfig):
         self.config = config
-        self.server = Server("digital-twin-advanced")
-        self.groq_client = Groq(api_key=config.groq_api_key) if config.groq_api_key else None
+        self.server = SubscribableServer("digital-twin-advanced")
+        self._groq_client = None
         self.redis_client = None
-        self.memory_cache: Dict[str, AgentMemory] = {}
-        self.reasoning_chains: Dict[str, List[ReasoningStep]] = {}
+        self.memory_store = SessionMemoryStore(config)
+        self.memory_cache = TwoTierMemoryCache(self.memory_store, config)
+        self.reasoning_chains = ReasoningChainIndex(config.reasoning_chain_limit)
+        self.analysis_executor = ThreadPoolExecutor(
+            max_workers=config.analysis_workers, thread_name_prefix="dt-analysis"
+        )
+        self.background_cancel = threading.Event()  # set at shutdown to stop background thread work
+        self.session_topics: "OrderedDict[str, TopicClusterer]" = OrderedDict()
+        self.analysis_cache = MaterializedAnalysisCache(config.analysis_cache_size, config.analysis_hot_window)
+        self._analysis_refresher: Optional[asyncio.Task] = None
+        self.feedback_queue = FeedbackIngestQueue(self._apply_feedback_batch, config)
+        self.step_memo = StepResultMemo(config.orchestration_memo_size, config.orchestration_memo_ttl)
+        self.source_compressor = ExtractiveCompressor(config.retrieval_embedding_dim)
+        self.request_outcomes: Dict[str, Dict[str, int]] = {}
+        self.connection_limiter: Optional[ConnectionLimiter] = None
+        self._backend_connector: Optional[asyncio.Task] = None
+        self.accepting_calls = True
+        self._in_flight_calls: set = set()
+        self._shutdown_started = False
+        self._http_server = None
+        self.descriptors = DescriptorRegistry(build_tool_definitions(), build_resource_definitions())
+        self.subscriptions = ResourceSubscriptions(
+            frozenset(SUBSCRIBABLE_RESOURCES), config.resource_notify_interval, config.resource_notify_timeout
+        )
+        self.serializer = JsonSerializer(pretty=config.json_format == "pretty")
+        self.tool_cache = StepResultMemo(self.config.tool_cache_size, self.config.tool_cache_ttl)
+        self.rate_limiters: Dict[str, TokenBucket] = {}
+        self.tool_latency = LatencySamples(config.tool_latency_window)
+        unregistered = self.descriptors.tool_names - TOOL_REGISTRY.names
+        if unregistered:
+            logger.warning(f"⚠️ Advertised tools without a handler: {sorted(unregistered)}")
         
         # Initialize server handlers
         self._setup_handlers()
         
     async def initialize(self):
-        """Initialize server components"""
+        """Initialize server components
+        
+        Optional backends connect in the background, so the MCP initialize
+        handshake is answered straight away. Until Redis is reachable,
+        memory is kept in-process; it is written through once Redis connects.
+        """
         try:
-            # Initialize Redis connection
-            if self.config.redis_url:
-                self.redis_client = redis.from_url(self.config.redis_url, decode_responses=True)
-                await self._test_redis_connection()
+            self._analysis_refresher = asyncio.create_task(self._refresh_hot_analyses())
+            self.feedback_queue.start()
+            self.subscriptions.start()
+            self._backend_connector = asyncio.create_task(self._connect_backends())
             
             logger.info("🚀 Advanced Digital Twin MCP Server initialized successfully")
             
@@ -114,14 +2674,144 @@ class AdvancedDigitalTwinServer:
             logger.error(f"❌ Failed to initialize server: {e}")
             raise
     
-    async def _test_redis_connection(self):
+    async def _connect_backends(self) -> None:
+        """Connect Redis and load persisted state off the startup path"""
+        if not self.config.redis_url:
+            return
+        try:
+            from redis.asyncio import BlockingConnectionPool, Redis
+            pool = BlockingConnectionPool.from_url(
+                self.config.redis_url,
+                max_connections=self.config.redis_pool_size,
+                timeout=self.config.redis_pool_timeout,
+                socket_timeout=self.config.redis_socket_timeout,
+                socket_connect_timeout=self.config.redis_socket_timeout,
+                decode_responses=True
+            )
+            self.redis_client = Redis.from_pool(pool)
+            if await self._test_redis_connection():
+                await self._attach_redis()
+        except Exception as e:
+            logger.warning(f"⚠️ Backend connection failed: {e}")
+            return
+        if self.memory_store.redis:
+            await self._follow_shared_state()
+    
+    async def _follow_shared_state(self) -> None:
+        """Pick up what other workers write to Redis, every shared_state_refresh_interval
+        
+        Each worker folds feedback into its own SectionPriors and clusters
+        the questions it serves. The priors are reloaded whenever their
+        Redis revision moves past the one loaded here, and questions other
+        workers added to dt:global:questions are fed to the cross-session
+        topic clusters, so neither depends on which worker took a call.
+        """
+        questions_after = "0-0"
+        while True:
+            try:
+                questions_after = await self._refresh_shared_state(questions_after)
+            except Exception as e:
+                logger.warning(f"⚠️ Shared state refresh failed: {e}")
+            await asyncio.sleep(self.config.shared_state_refresh_interval)
+    
+    async def _refresh_shared_state(self, questions_after: str) -> str:
+        """One poll of _follow_shared_state; returns the last question stream id read"""
+        redis_client = self.memory_store.redis
+        revision = int(await self.memory_store.timed(
+            "hget", redis_client.hget(SectionPriors.META_KEY, "revision")
+        ) or 0)
+        if revision != self.section_priors.shared_revision:
+            pipe = redis_client.pipeline()
+            pipe.hgetall(SectionPriors.REDIS_KEY)
+            pipe.hget(SectionPriors.META_KEY, "revision")
+            priors, revision = await self.memory_store.timed("load_priors", pipe.execute())
+            self.section_priors.load(priors, int(revision or 0))
+        
+        questions, questions_after = await self.memory_store.read_global_questions(
+            questions_after, self.config.topic_max_pending
+        )
+        for question in questions:
+            self.global_topics.add(question)
+        return questions_after
+    
+    async def _attach_redis(self) -> None:
+        """Move memory and priors onto Redis, persisting what was recorded before it connected
+        
+        Until now writes were kept in-process only. Feedback counts are
+        added to the Redis priors before they are loaded, and resident
+        sessions are replayed as ordinary writes, which also feeds the
+        dt:global aggregates. Sessions already evicted from L1 before the
+        connection are not recoverable.
+        """
+        local_priors = self.section_priors.increments()
+        resident = self.memory_cache.take_all()
+        self.memory_store.attach(self.redis_client)
+        
+        pipe = self.redis_client.pipeline()
+        for field, amount in local_priors.items():
+            pipe.hincrby(SectionPriors.REDIS_KEY, field, amount)
+        if local_priors:
+            pipe.hincrby(SectionPriors.META_KEY, "revision", 1)
+        pipe.hgetall(SectionPriors.REDIS_KEY)
+        pipe.hget(SectionPriors.META_KEY, "revision")
+        *_, priors, revision = await self.memory_store.timed("load_priors", pipe.execute())
+        self.section_priors.load(priors, int(revision or 0))
+        
+        for memory in resident:
+            session_id = memory.conversation_id
+            for interaction in memory.interaction_history:
+                await self.memory_cache.append_interaction(session_id, interaction)
+            for section in SessionMemoryStore.HASH_SECTIONS:
+                if getattr(memory, section):
+                    await self.memory_cache.update_fields(session_id, section, getattr(memory, section))
+        if resident:
+            logger.info(f"💾 Persisted {len(resident)} sessions recorded before Redis connected")
+    
+    async def _test_redis_connection(self) -> bool:
         """Test Redis connection"""
         try:
             if self.redis_client:
-                self.redis_client.ping()
+                await self.memory_store.timed("ping", self.redis_client.ping())
                 logger.info("✅ Redis connection established")
+                return True
         except Exception as e:
             logger.warning(f"⚠️ Redis connection failed: {e}")
+        return False
+    
+    @property
+    def groq_client(self):
+        """Async Groq client, created (and the SDK imported) on first use
+        
+        Async so completions run on the event loop's I/O rather than
+        blocking it, and so ``current_request().run`` can cancel them at the
+        deadline.
+        """
+        if self._groq_client is None and self.config.groq_api_key:
+            from groq import AsyncGroq
+            self._groq_client = AsyncGroq(api_key=self.config.groq_api_key)
+        return self._groq_client
+    
+    # NumPy-backed state is built on first use rather than in __init__, so
+    # constructing the server and answering the handshake never loads NumPy
+    
+    @cached_property
+    def knowledge_index(self) -> KnowledgeIndex:
+        return KnowledgeIndex.load(self.config.knowledge_base_path, self.config.retrieval_embedding_dim)
+    
+    @cached_property
+    def section_priors(self) -> SectionPriors:
+        return SectionPriors(self.knowledge_index.section_ids, self.config.section_prior_strength)
+    
+    @cached_property
+    def source_deduplicator(self) -> MinHashDeduplicator:
+        return MinHashDeduplicator(
+            self.config.dedup_threshold, self.config.minhash_permutations, self.config.minhash_bands,
+            self.config.shingle_size
+        )
+    
+    @cached_property
+    def global_topics(self) -> TopicClusterer:
+        return self._new_topic_clusterer()
     
     def _setup_handlers(self):
         """Setup MCP server handlers"""
@@ -129,300 +2819,109 @@ class AdvancedDigitalTwinServer:
         @self.server.list_tools()
         async def handle_list_tools() -> ListToolsResult:
             """List all available advanced tools"""
-            return ListToolsResult(
-                tools=[
-                    Tool(
-                        name="advanced_query",
-                        description="Advanced query with multi-step reasoning and context awareness",
-                        inputSchema={
-                            "type": "object",
-                            "properties": {
-                                "question": {
-                                    "type": "string",
-                                    "description": "The question to process with advanced reasoning"
-                                },
-                                "reasoning_mode": {
-                                    "type": "string",
-                                    "enum": ["simple", "analytical", "creative", "strategic"],
-                                    "description": "The reasoning approach to use",
-                                    "default": "analytical"
-                                },
-                                "context_depth": {
-                                    "type": "integer",
-                                    "minimum": 1,
-                                    "maximum": 10,
-                                    "description": "Depth of context to consider",
-                                    "default": 5
-                                },
-                                "include_reasoning_steps": {
-                                    "type": "boolean",
-                                    "description": "Whether to include reasoning steps in response",
-                                    "default": False
-                                }
-                            },
-                            "required": ["question"]
-                        }
-                    ),
-                    
-                    Tool(
-                        name="memory_analysis",
-                        description="Analyze and extract insights from conversation memory",
-                        inputSchema={
-                            "type": "object",
-                            "properties": {
-                                "analysis_type": {
-                                    "type": "string",
-                                    "enum": ["user_profile", "preferences", "patterns", "sentiment", "topics"],
-                                    "description": "Type of memory analysis to perform"
-                                },
-                                "session_id": {
-                                    "type": "string",
-                                    "description": "Session ID to analyze"
-                                },
-                                "time_range": {
-                                    "type": "string",
-                                    "enum": ["last_hour", "last_day", "last_week", "all_time"],
-                                    "description": "Time range for analysis",
-                                    "default": "all_time"
-                                }
-                            },
-                            "required": ["analysis_type"]
-                        }
-                    ),
-                    
-                    Tool(
-                        name="tool_orchestration",
-                        description="Orchestrate multiple tools to solve complex problems",
-                        inputSchema={
-                            "type": "object",
-                            "properties": {
-                                "goal": {
-                                    "type": "string",
-                                    "description": "The high-level goal to achieve"
-                                },
-                                "available_tools": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "List of available tools to orchestrate"
-                                },
-                                "constraints": {
-                                    "type": "object",
-                                    "description": "Constraints and preferences for orchestration"
-                                },
-                                "max_steps": {
-                                    "type": "integer",
-                                    "minimum": 1,
-                                    "maximum": 20,
-                                    "description": "Maximum number of orchestration steps",
-                                    "default": 10
-                                }
-                            },
-                            "required": ["goal"]
-                        }
-                    ),
-                    
-                    Tool(
-                        name="context_synthesis",
-                        description="Synthesize information from multiple sources with advanced reasoning",
-                        inputSchema={
-                            "type": "object",
-                            "properties": {
-                                "sources": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "type": {"type": "string"},
-                                            "content": {"type": "string"},
-                                            "weight": {"type": "number", "minimum": 0, "maximum": 1}
-                                        }
-                                    },
-                                    "description": "Information sources to synthesize"
-                                },
-                                "synthesis_goal": {
-                                    "type": "string",
-                                    "description": "Goal of the synthesis process"
-                                },
-                                "output_format": {
-                                    "type": "string",
-                                    "enum": ["summary", "analysis", "recommendations", "insights"],
-                                    "description": "Desired output format",
-                                    "default": "analysis"
-                                }
-                            },
-                            "required": ["sources", "synthesis_goal"]
-                        }
-                    ),
-                    
-                    Tool(
-                        name="adaptive_learning",
-                        description="Learn and adapt from interactions to improve responses",
-                        inputSchema={
-                            "type": "object",
-                            "properties": {
-                                "interaction_data": {
-                                    "type": "object",
-                                    "description": "Data from recent interactions"
-                                },
-                                "learning_focus": {
-                                    "type": "string",
-                                    "enum": ["user_preferences", "communication_style", "topic_expertise", "response_quality"],
-                                    "description": "Focus area for learning"
-                                },
-                                "feedback": {
-                                    "type": "object",
-                                    "description": "User feedback on responses"
-                                }
-                            },
-                            "required": ["interaction_data", "learning_focus"]
-                        }
-                    ),
-                    
-                    Tool(
-                        name="performance_analytics",
-                        description="Analyze server performance and usage patterns",
-                        inputSchema={
-                            "type": "object",
-                            "properties": {
-                                "metric_type": {
-                                    "type": "string",
-                                    "enum": ["response_time", "tool_usage", "error_rates", "user_satisfaction", "memory_usage"],
-                                    "description": "Type of performance metric to analyze"
-                                },
-                                "time_period": {
-                                    "type": "string",
-                                    "enum": ["last_hour", "last_day", "last_week", "last_month"],
-                                    "description": "Time period for analysis",
-                                    "default": "last_day"
-                                },
-                                "aggregation": {
-                                    "type": "string",
-                                    "enum": ["average", "median", "percentiles", "distribution"],
-                                    "description": "How to aggregate the data",
-                                    "default": "average"
-                                }
-                            },
-                            "required": ["metric_type"]
-                        }
-                    )
-                ]
-            )
+            return self.descriptors.tools_result
         
         @self.server.call_tool()
         async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> CallResult:
             """Handle tool calls with advanced processing"""
+            if name not in TOOL_REGISTRY:
+                counts = self.request_outcomes.setdefault("<unknown>", {})
+                counts["unknown"] = counts.get("unknown", 0) + 1
+                return CallResult(
+                    content=[TextContent(type="text", text=f"Unknown tool: {name}")],
+                    isError=True
+                )
+            
+            call = ToolCall(server=self, name=name, arguments=arguments)
+            if not self.accepting_calls:
+                call.outcome = "rejected"
+                counts = self.request_outcomes.setdefault(name, {})
+                counts["rejected"] = counts.get("rejected", 0) + 1
+                return CallResult(
+                    content=[TextContent(type="text", text="Server is shutting down, retry shortly")],
+                    isError=True
+                )
+            
+            task = asyncio.current_task()
+            self._in_flight_calls.add(task)
             try:
                 logger.info(f"🔧 Executing advanced tool: {name}")
-                
-                if name == "advanced_query":
-                    return await self._handle_advanced_query(arguments)
-                elif name == "memory_analysis":
-                    return await self._handle_memory_analysis(arguments)
-                elif name == "tool_orchestration":
-                    return await self._handle_tool_orchestration(arguments)
-                elif name == "context_synthesis":
-                    return await self._handle_context_synthesis(arguments)
-                elif name == "adaptive_learning":
-                    return await self._handle_adaptive_learning(arguments)
-                elif name == "performance_analytics":
-                    return await self._handle_performance_analytics(arguments)
-                else:
-                    return CallResult(
-                        content=[TextContent(type="text", text=f"Unknown tool: {name}")]
-                    )
-                    
+                result = await TOOL_REGISTRY.dispatch(call)
+                if result.isError and call.outcome == "ok":
+                    call.outcome = "error"
+                return result
+            except asyncio.CancelledError:
+                call.outcome = "cancelled"
+                raise
             except Exception as e:
+                call.outcome = "error"
                 logger.error(f"❌ Tool execution error: {e}")
                 return CallResult(
-                    content=[TextContent(type="text", text=f"Tool execution failed: {str(e)}")]
+                    content=[TextContent(type="text", text=f"Tool execution failed: {str(e)}")],
+                    isError=True
                 )
+            finally:
+                self._in_flight_calls.discard(task)
+                counts = self.request_outcomes.setdefault(name, {})
+                counts[call.outcome] = counts.get(call.outcome, 0) + 1
+                self.subscriptions.mark_changed("analytics://performance-metrics")
         
         @self.server.list_resources()
         async def handle_list_resources() -> ListResourcesResult:
             """List available resources"""
-            return ListResourcesResult(
-                resources=[
-                    Resource(
-                        uri="memory://agent-memory",
-                        name="Agent Memory System",
-                        description="Access to persistent agent memory and learning"
-                    ),
-                    Resource(
-                        uri="analytics://performance-metrics",
-                        name="Performance Analytics",
-                        description="Server performance and usage analytics"
-                    ),
-                    Resource(
-                        uri="reasoning://chains",
-                        name="Reasoning Chains",
-                        description="Access to multi-step reasoning processes"
-                    )
-                ]
-            )
+            return self.descriptors.resources_result
+        
+        @self.server.subscribe_resource()
+        async def handle_subscribe_resource(uri: str) -> None:
+            """Push resources/updated for uri to the calling session"""
+            self.subscriptions.subscribe(str(uri), self.server.request_context.session)
+        
+        @self.server.unsubscribe_resource()
+        async def handle_unsubscribe_resource(uri: str) -> None:
+            """Stop pushing updates for uri to the calling session"""
+            self.subscriptions.unsubscribe(str(uri), self.server.request_context.session)
         
         @self.server.read_resource()
-        async def handle_read_resource(uri: str) -> ReadResourceResult:
-            """Read resource content"""
+        async def handle_read_resource(uri: str) -> List[ReadResourceContents]:
+            """Read resource content
+            
+            Unknown URIs and failures are raised, so the client receives a
+            JSON-RPC error rather than error text posing as the resource.
+            """
+            uri = str(uri)
             try:
                 if uri == "memory://agent-memory":
-                    memory_data = await self._get_memory_snapshot()
-                    return ReadResourceResult(
-                        contents=[
-                            TextContent(
-                                type="text",
-                                text=json.dumps(memory_data, indent=2, default=str)
-                            )
-                        ]
-                    )
+                    data = await self._get_memory_snapshot()
                 elif uri == "analytics://performance-metrics":
-                    analytics_data = await self._get_performance_metrics()
-                    return ReadResourceResult(
-                        contents=[
-                            TextContent(
-                                type="text",
-                                text=json.dumps(analytics_data, indent=2, default=str)
-                            )
-                        ]
-                    )
-                elif uri == "reasoning://chains":
-                    reasoning_data = await self._get_reasoning_chains()
-                    return ReadResourceResult(
-                        contents=[
-                            TextContent(
-                                type="text",
-                                text=json.dumps(reasoning_data, indent=2, default=str)
-                            )
-                        ]
-                    )
+                    data = await self._get_performance_metrics()
+                elif uri == "reasoning://chains" or uri.startswith("reasoning://chains?"):
+                    data = await self._get_reasoning_chains(uri)
                 else:
-                    return ReadResourceResult(
-                        contents=[
-                            TextContent(type="text", text=f"Resource not found: {uri}")
-                        ]
-                    )
+                    raise ValueError(f"Resource not found: {uri}")
             except Exception as e:
                 logger.error(f"❌ Resource read error: {e}")
-                return ReadResourceResult(
-                    contents=[
-                        TextContent(type="text", text=f"Failed to read resource: {str(e)}")
-                    ]
-                )
+                raise
+            return [ReadResourceContents(content=self.serializer.dumps(data), mime_type="application/json")]
     
+    @TOOL_REGISTRY.tool("advanced_query", rate_limited, timed, with_deadline)
     async def _handle_advanced_query(self, arguments: Dict[str, Any]) -> CallResult:
         """Handle advanced query with multi-step reasoning"""
         question = arguments.get("question", "")
         reasoning_mode = arguments.get("reasoning_mode", "analytical")
         context_depth = arguments.get("context_depth", 5)
         include_steps = arguments.get("include_reasoning_steps", False)
+        session_id = arguments.get("session_id")
         
         if not question:
             return CallResult(
-                content=[TextContent(type="text", text="Question is required")]
+                content=[TextContent(type="text", text="Question is required")],
+                isError=True
             )
         
         # Initialize reasoning chain
         chain_id = str(uuid.uuid4())
-        self.reasoning_chains[chain_id] = []
+        self.reasoning_chains.create(chain_id, reasoning_mode)
+        self.subscriptions.mark_changed("reasoning://chains")
         
         try:
             # Step 1: Context gathering
@@ -432,7 +2931,7 @@ class AdvancedDigitalTwinServer:
                 output_data={},
                 confidence=0.9
             )
-            self.reasoning_chains[chain_id].append(context_step)
+            self.reasoning_chains.add_step(chain_id, context_step)
             
             # Simulate context gathering (in real implementation, this would query vector DB)
             relevant_context = await self._gather_context(question, context_depth)
@@ -446,7 +2945,7 @@ class AdvancedDigitalTwinServer:
                 confidence=0.85,
                 dependencies=[context_step.step_id]
             )
-            self.reasoning_chains[chain_id].append(analysis_step)
+            self.reasoning_chains.add_step(chain_id, analysis_step)
             
             question_analysis = await self._analyze_question(question, reasoning_mode)
             analysis_step.output_data = question_analysis
@@ -464,18 +2963,30 @@ class AdvancedDigitalTwinServer:
                 confidence=0.88,
                 dependencies=[context_step.step_id, analysis_step.step_id]
             )
-            self.reasoning_chains[chain_id].append(generation_step)
+            self.reasoning_chains.add_step(chain_id, generation_step)
             
             response = await self._generate_advanced_response(
                 question, relevant_context, question_analysis, reasoning_mode
             )
             generation_step.output_data = {"response": response}
             
+            if session_id:
+                await self._record_interaction(session_id, {
+                    "question": question,
+                    "response": response,
+                    "reasoning_mode": reasoning_mode,
+                    "chain_id": chain_id,
+                    "sections": relevant_context["sources"],
+                    "topics": extract_topics(question),
+                    "sentiment": score_sentiment(question),
+                    "timestamp": datetime.now().isoformat()
+                })
+            
             # Prepare result
             result_content = [TextContent(type="text", text=response)]
             
             if include_steps:
-                reasoning_summary = self._format_reasoning_steps(self.reasoning_chains[chain_id])
+                reasoning_summary = self._format_reasoning_steps(self.reasoning_chains.steps(chain_id))
                 result_content.append(
                     TextContent(
                         type="text", 
@@ -488,50 +2999,81 @@ class AdvancedDigitalTwinServer:
         except Exception as e:
             logger.error(f"❌ Advanced query error: {e}")
             return CallResult(
-                content=[TextContent(type="text", text=f"Advanced query failed: {str(e)}")]
+                content=[TextContent(type="text", text=f"Advanced query failed: {str(e)}")],
+                isError=True
             )
     
+    @TOOL_REGISTRY.tool("memory_analysis", timed, with_deadline)
     async def _handle_memory_analysis(self, arguments: Dict[str, Any]) -> CallResult:
         """Handle memory analysis requests"""
         analysis_type = arguments.get("analysis_type", "user_profile")
         session_id = arguments.get("session_id")
         time_range = arguments.get("time_range", "all_time")
         
+        if analysis_type not in self.MEMORY_ANALYZERS:
+            return CallResult(
+                content=[TextContent(type="text", text=f"Unknown analysis type: {analysis_type}")],
+                isError=True
+            )
+        
         try:
-            # Get memory data
-            memory_data = await self._get_memory_data(session_id, time_range)
-            
-            # Perform analysis based on type
-            if analysis_type == "user_profile":
-                analysis_result = await self._analyze_user_profile(memory_data)
-            elif analysis_type == "preferences":
-                analysis_result = await self._analyze_preferences(memory_data)
-            elif analysis_type == "patterns":
-                analysis_result = await self._analyze_patterns(memory_data)
-            elif analysis_type == "sentiment":
-                analysis_result = await self._analyze_sentiment(memory_data)
-            elif analysis_type == "topics":
-                analysis_result = await self._analyze_topics(memory_data)
-            else:
-                return CallResult(
-                    content=[TextContent(type="text", text=f"Unknown analysis type: {analysis_type}")]
-                )
+            key = (analysis_type, session_id, time_range)
+            version = await self._analysis_version(session_id, time_range)
+            text = self.analysis_cache.get(key, version)
+            if text is None:
+                text = await self._materialize_analysis(key, version)
             
             return CallResult(
-                content=[
-                    TextContent(
-                        type="text",
-                        text=json.dumps(analysis_result, indent=2, default=str)
-                    )
-                ]
+                content=[TextContent(type="text", text=text)]
             )
             
         except Exception as e:
             logger.error(f"❌ Memory analysis error: {e}")
             return CallResult(
-                content=[TextContent(type="text", text=f"Memory analysis failed: {str(e)}")]
+                content=[TextContent(type="text", text=f"Memory analysis failed: {str(e)}")],
+                isError=True
             )
     
+    MEMORY_ANALYZERS = {
+        "user_profile": "_analyze_user_profile",
+        "preferences": "_analyze_preferences",
+        "patterns": "_analyze_patterns",
+        "sentiment": "_analyze_sentiment",
+        "topics": "_analyze_topics",
+    }
+    
+    async def _analysis_version(self, session_id: Optional[str], time_range: str) -> Tuple[int, int]:
+        """(write stamp, time bucket) that a materialized analysis is valid for"""
+        if session_id:
+            stamp = (await self._get_session_memory(session_id)).version
+        else:
+            stamp = await self.memory_store.get_global_version()
+        granularity = TIME_RANGE_BUCKETS.get(time_range, (0, 0))[0]
+        slot = int(time.time() // granularity) if granularity else 0
+        return stamp, slot
+    
+    async def _materialize_analysis(self, key: Tuple[str, Optional[str], str], version: Tuple[int, int]) -> str:
+        """Run an analysis and store its serialized result under version"""
+        analysis_type, session_id, time_range = key
+        memory_data = await self._get_memory_data(session_id, time_range)
+        analysis_result = await getattr(self, self.MEMORY_ANALYZERS[analysis_type])(memory_data)
+        text = self.serializer.dumps(analysis_result)
+        self.analysis_cache.put(key, version, text)
+        return text
+    
+    async def _refresh_hot_analyses(self) -> None:
+        """Recompute stale hot analyses ahead of the next dashboard poll"""
+        while True:
+            await asyncio.sleep(self.config.analysis_refresh_interval)
+            for key, cached_version in self.analysis_cache.hot_keys():
+                try:
+                    version = await self._analysis_version(key[1], key[2])
+                    if version != cached_version:
+                        await self._materialize_analysis(key, version)
+                except Exception as e:
+                    logger.warning(f"⚠️ Background analysis refresh failed for {key}: {e}")
+    
+    @TOOL_REGISTRY.tool("tool_orchestration", rate_limited, timed, with_deadline)
     async def _handle_tool_orchestration(self, arguments: Dict[str, Any]) -> CallResult:
         """Handle tool orchestration for complex problem solving"""
         goal = arguments.get("goal", "")
@@ -541,21 +3083,30 @@ class AdvancedDigitalTwinServer:
         
         if not goal:
             return CallResult(
-                content=[TextContent(type="text", text="Goal is required for orchestration")]
+                content=[TextContent(type="text", text="Goal is required for orchestration")],
+                isError=True
             )
         
         try:
             # Plan orchestration steps
             orchestration_plan = await self._plan_orchestration(goal, available_tools, constraints, max_steps)
+            if not orchestration_plan:
+                return CallResult(
+                    content=[TextContent(type="text", text="No orchestratable tools available for this goal")],
+                    isError=True
+                )
             
-            # Execute orchestration
-            execution_results = []
-            for step in orchestration_plan:
-                step_result = await self._execute_orchestration_step(step)
-                execution_results.append(step_result)
+            # Execute independent steps concurrently
+            step_timeout = min(
+                float(constraints.get("step_timeout", self.config.orchestration_step_timeout)),
+                self.config.orchestration_step_timeout,
+                current_request().remaining()
+            )
+            dag = OrchestrationDAG(orchestration_plan, self.config.orchestration_max_concurrency, step_timeout)
+            execution_report = await dag.run(self._execute_orchestration_step)
             
             # Synthesize final result
-            final_result = await self._synthesize_orchestration_results(goal, execution_results)
+            final_result = await self._synthesize_orchestration_results(goal, execution_report)
             
             return CallResult(
                 content=[
@@ -566,9 +3117,11 @@ class AdvancedDigitalTwinServer:
         except Exception as e:
             logger.error(f"❌ Tool orchestration error: {e}")
             return CallResult(
-                content=[TextContent(type="text", text=f"Tool orchestration failed: {str(e)}")]
+                content=[TextContent(type="text", text=f"Tool orchestration failed: {str(e)}")],
+                isError=True
             )
     
+    @TOOL_REGISTRY.tool("context_synthesis", rate_limited, timed, with_deadline, cached)
     async def _handle_context_synthesis(self, arguments: Dict[str, Any]) -> CallResult:
         """Handle context synthesis from multiple sources"""
         sources = arguments.get("sources", [])
@@ -577,13 +3130,20 @@ class AdvancedDigitalTwinServer:
         
         if not sources or not synthesis_goal:
             return CallResult(
-                content=[TextContent(type="text", text="Sources and synthesis goal are required")]
+                content=[TextContent(type="text", text="Sources and synthesis goal are required")],
+                isError=True
             )
         
         try:
+            # Stream referenced sources down to their best sentences
+            sources = await self._resolve_source_references(sources, synthesis_goal, arguments.get("session_id"))
+            
             # Process and weight sources
             processed_sources = await self._process_sources(sources)
             
+            # Compress to the upstream token budget
+            processed_sources = await self._compress_sources(processed_sources, synthesis_goal)
+            
             # Synthesize information
             synthesis_result = await self._synthesize_information(
                 processed_sources, synthesis_goal, output_format
@@ -596,9 +3156,11 @@ class AdvancedDigitalTwinServer:
         except Exception as e:
             logger.error(f"❌ Context synthesis error: {e}")
             return CallResult(
-                content=[TextContent(type="text", text=f"Context synthesis failed: {str(e)}")]
+                content=[TextContent(type="text", text=f"Context synthesis failed: {str(e)}")],
+                isError=True
             )
     
+    @TOOL_REGISTRY.tool("adaptive_learning", timed, with_deadline)
     async def _handle_adaptive_learning(self, arguments: Dict[str, Any]) -> CallResult:
         """Handle adaptive learning from interactions"""
         interaction_data = arguments.get("interaction_data", {})
@@ -606,19 +3168,25 @@ class AdvancedDigitalTwinServer:
         feedback = arguments.get("feedback", {})
         
         try:
-            # Process learning data
-            learning_insights = await self._process_learning_data(
-                interaction_data, learning_focus, feedback
-            )
-            
-            # Update memory with learned insights
-            await self._update_learned_patterns(learning_insights)
+            event_id = str(uuid.uuid4())
+            queued = await self.feedback_queue.submit({
+                "event_id": event_id,
+                "interaction_data": interaction_data,
+                "learning_focus": learning_focus,
+                "feedback": feedback,
+                "received_at": datetime.now().isoformat()
+            })
+            if not queued:
+                return CallResult(
+                    content=[TextContent(type="text", text="Adaptive learning is busy; feedback was not accepted, please retry")],
+                    isError=True
+                )
             
             return CallResult(
                 content=[
                     TextContent(
                         type="text",
-                        text=f"Learning completed. Insights: {json.dumps(learning_insights, indent=2)}"
+                        text=f"Feedback queued for learning (event {event_id}, {len(self.feedback_queue)} pending)"
                     )
                 ]
             )
@@ -626,9 +3194,11 @@ class AdvancedDigitalTwinServer:
         except Exception as e:
             logger.error(f"❌ Adaptive learning error: {e}")
             return CallResult(
-                content=[TextContent(type="text", text=f"Adaptive learning failed: {str(e)}")]
+                content=[TextContent(type="text", text=f"Adaptive learning failed: {str(e)}")],
+                isError=True
             )
     
+    @TOOL_REGISTRY.tool("performance_analytics", timed, with_deadline)
     async def _handle_performance_analytics(self, arguments: Dict[str, Any]) -> CallResult:
         """Handle performance analytics requests"""
         metric_type = arguments.get("metric_type", "response_time")
@@ -643,7 +3213,7 @@ class AdvancedDigitalTwinServer:
                 content=[
                     TextContent(
                         type="text",
-                        text=json.dumps(metrics, indent=2, default=str)
+                        text=self.serializer.dumps(metrics)
                     )
                 ]
             )
@@ -651,16 +3221,21 @@ class AdvancedDigitalTwinServer:
         except Exception as e:
             logger.error(f"❌ Performance analytics error: {e}")
             return CallResult(
-                content=[TextContent(type="text", text=f"Performance analytics failed: {str(e)}")]
+                content=[TextContent(type="text", text=f"Performance analytics failed: {str(e)}")],
+                isError=True
             )
     
     # Helper methods (simplified implementations for demo)
     async def _gather_context(self, question: str, depth: int) -> Dict[str, Any]:
         """Gather relevant context for question"""
+        top_k = max(1, min(depth, self.config.retrieval_top_k))
+        current_request().check("knowledge retrieval")
+        matches = self.knowledge_index.search(question, top_k, self.section_priors.bias)
         return {
-            "relevant_info": f"Context for: {question}",
+            "relevant_info": "\n\n".join(section["content"] for section, _ in matches)[:self.config.max_context_length],
             "depth_level": depth,
-            "sources": ["profile", "memory", "knowledge_base"]
+            "sources": [section["id"] for section, _ in matches],
+            "scores": [round(score, 4) for _, score in matches]
         }
     
     async def _analyze_question(self, question: str, mode: str) -> Dict[str, Any]:
@@ -689,7 +3264,7 @@ class AdvancedDigitalTwinServer:
         """
         
         try:
-            response = await self.groq_client.chat.completions.create(
+            response = await current_request().run(self.groq_client.chat.completions.create(
                 model="llama-3.1-8b-instant",
                 messages=[
                     {"role": "system", "content": "You are DIGI-EARL, an advanced AI digital twin with enhanced reasoning capabilities."},
@@ -697,13 +3272,14 @@ class AdvancedDigitalTwinServer:
                 ],
                 temperature=self.config.reasoning_temperature,
                 max_tokens=1000
-            )
+            ), "LLM completion")
             
             return response.choices[0].message.content.strip()
             
         except Exception as e:
+            # Raised rather than answered with a template, so the call is reported as failed
             logger.error(f"❌ Groq API error: {e}")
-            return f"Advanced response for: {question} (reasoning mode: {mode})"
+            raise
     
     def _format_reasoning_steps(self, steps: List[ReasoningStep]) -> str:
         """Format reasoning steps for display"""
@@ -714,89 +3290,503 @@ class AdvancedDigitalTwinServer:
             formatted += f"   - Dependencies: {', '.join(step.dependencies) if step.dependencies else 'None'}\n\n"
         return formatted
     
+    async def _get_session_memory(self, session_id: str) -> AgentMemory:
+        """Return the resident memory for a session, loading it lazily"""
+        return await self.memory_cache.get(session_id)
+    
+    async def _record_interaction(self, session_id: str, interaction: Dict[str, Any]) -> None:
+        """Append an interaction to session memory"""
+        try:
+            await self.memory_cache.append_interaction(session_id, interaction)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to record interaction for {session_id}: {e}")
+        self.subscriptions.mark_changed("memory://agent-memory")
+        question = interaction.get("question", "")
+        self.global_topics.add(question)
+        if session_id in self.session_topics:
+            self.session_topics[session_id].add(question)
+    
+    def _new_topic_clusterer(self) -> TopicClusterer:
+        return TopicClusterer(
+            self.config.topic_clusters, self.config.topic_embedding_dim, self.config.topic_refresh_after,
+            self.config.topic_max_pending, self.analysis_executor, self.background_cancel
+        )
+    
+    async def _get_topic_clusterer(self, session_id: Optional[str]) -> TopicClusterer:
+        """Global clusterer, or a per-session one seeded from its resident window"""
+        if not session_id:
+            return self.global_topics
+        clusterer = self.session_topics.get(session_id)
+        if clusterer is None:
+            clusterer = self._new_topic_clusterer()
+            memory = await self._get_session_memory(session_id)
+            for interaction in memory.interaction_history:
+                clusterer.add(interaction.get("question", ""))
+            self.session_topics[session_id] = clusterer
+            while len(self.session_topics) > self.config.topic_max_sessions:
+                self.session_topics.popitem(last=False)
+        self.session_topics.move_to_end(session_id)
+        return clusterer
+    
     async def _get_memory_data(self, session_id: Optional[str], time_range: str) -> Dict[str, Any]:
-        """Get memory data for analysis"""
-        # Simplified implementation
+        """Get memory data for analysis
+        
+        Without a session_id the global aggregates are used, which cover
+        every session whether or not it is resident in this process.
+        """
+        if not session_id:
+            aggregates, recent = await self.memory_store.load_global(time_range)
+            return {
+                "session_id": None,
+                "time_range": time_range,
+                "recent_interactions": [recent],
+                "aggregates": aggregates,
+                "user_profile": {},
+                "preferences": {}
+            }
+        
+        memory = await self._get_session_memory(session_id)
+        if time_range in TIME_RANGE_BUCKETS:
+            aggregates = memory.time_index.query(time_range)
+        else:
+            aggregates = memory.aggregates
         return {
             "session_id": session_id,
             "time_range": time_range,
-            "interactions": [],
-            "user_profile": {},
-            "preferences": {}
+            "recent_interactions": [memory.interaction_history],
+            "aggregates": aggregates,
+            "user_profile": memory.user_profile,
+            "preferences": memory.preferences
         }
     
+    @staticmethod
+    def _aggregate_confidence(count: int) -> float:
+        """Confidence grows with the amount of evidence, capped below 1"""
+        return round(min(0.95, 0.3 + 0.1 * math.sqrt(count)), 2) if count else 0.0
+    
+    @staticmethod
+    def _top_keys(counts: Dict[str, int], limit: int = 3) -> List[str]:
+        return [key for key, _ in sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:limit]]
+    
     async def _analyze_user_profile(self, memory_data: Dict) -> Dict[str, Any]:
         """Analyze user profile from memory"""
+        aggregates: InteractionAggregates = memory_data["aggregates"]
+        count = aggregates.interaction_count
+        insights = []
+        if count:
+            avg_chars = aggregates.question_chars / count
+            insights.append(
+                "User prefers detailed explanations" if avg_chars > 120 else "User asks concise questions"
+            )
+            top_topics = self._top_keys(aggregates.topic_counts)
+            if top_topics:
+                insights.append(f"Interested in {', '.join(top_topics)}")
         return {
             "analysis_type": "user_profile",
-            "insights": ["User prefers detailed explanations", "Interested in technical topics"],
-            "confidence": 0.85
+            "profile": memory_data["user_profile"],
+            "insights": insights,
+            "interactions": count,
+            "confidence": self._aggregate_confidence(count)
         }
     
     async def _analyze_preferences(self, memory_data: Dict) -> Dict[str, Any]:
         """Analyze user preferences"""
+        aggregates: InteractionAggregates = memory_data["aggregates"]
+        preferences = dict(memory_data["preferences"])
+        if aggregates.mode_counts:
+            preferences.setdefault("reasoning_mode", self._top_keys(aggregates.mode_counts, 1)[0])
+        if aggregates.interaction_count:
+            avg_chars = aggregates.question_chars / aggregates.interaction_count
+            preferences.setdefault("detail_level", "high" if avg_chars > 120 else "moderate")
         return {
             "analysis_type": "preferences",
-            "preferences": {"communication_style": "formal", "detail_level": "high"},
-            "confidence": 0.78
+            "preferences": preferences,
+            "confidence": self._aggregate_confidence(aggregates.interaction_count)
         }
     
     async def _analyze_patterns(self, memory_data: Dict) -> Dict[str, Any]:
         """Analyze interaction patterns"""
+        aggregates: InteractionAggregates = memory_data["aggregates"]
+        count = aggregates.interaction_count
+        patterns = []
+        peak_hours = []
+        if count:
+            follow_up_rate = aggregates.follow_ups / count
+            if follow_up_rate >= 0.3:
+                patterns.append("Asks follow-up questions")
+            histogram = aggregates.hour_histogram
+            peak_hours = sorted(range(24), key=lambda hour: histogram[hour], reverse=True)[:3]
+            peak_hours = [hour for hour in peak_hours if histogram[hour]]
+            day_part = ["night", "morning", "afternoon", "evening"][peak_hours[0] // 6]
+            patterns.append(f"Prefers {day_part} interactions")
         return {
             "analysis_type": "patterns",
-            "patterns": ["Asks follow-up questions", "Prefers morning interactions"],
-            "confidence": 0.82
+            "patterns": patterns,
+            "peak_hours": peak_hours,
+            "hour_histogram": aggregates.hour_histogram,
+            "follow_up_rate": round(aggregates.follow_ups / count, 3) if count else 0.0,
+            "confidence": self._aggregate_confidence(count)
         }
     
     async def _analyze_sentiment(self, memory_data: Dict) -> Dict[str, Any]:
-        """Analyze sentiment from interactions"""
+        """Analyze sentiment from interactions
+        
+        The trend only uses recent interactions inside time_range, like
+        the aggregates behind the overall score.
+        """
+        aggregates: InteractionAggregates = memory_data["aggregates"]
+        count = aggregates.sentiment_count
+        mean = aggregates.sentiment_sum / count if count else 0.0
+        
+        window = self.config.sentiment_trend_window
+        recent = [list(history) for history in memory_data["recent_interactions"]]
+        if memory_data["time_range"] in TIME_RANGE_BUCKETS:
+            cutoff = datetime.now().timestamp() - TIME_RANGE_BUCKETS[memory_data["time_range"]][1]
+            recent = [
+                [item for item in history if interaction_time(item).timestamp() >= cutoff]
+                for history in recent
+            ]
+        recent = [history[-window:] for history in recent]
+        loop = asyncio.get_running_loop()
+        slopes = await current_request().run(
+            loop.run_in_executor(
+                self.analysis_executor, self._sentiment_slopes, recent, current_request().cancel_token
+            ),
+            "sentiment trend"
+        )
+        slope = float(np.mean(slopes)) if slopes else 0.0
+        
         return {
             "analysis_type": "sentiment",
-            "overall_sentiment": "positive",
-            "sentiment_trend": "improving",
-            "confidence": 0.89
+            "overall_sentiment": "positive" if mean > 0.1 else "negative" if mean < -0.1 else "neutral",
+            "sentiment_score": round(mean, 3),
+            "sentiment_trend": "improving" if slope > 0.01 else "declining" if slope < -0.01 else "stable",
+            "trend_slope": round(slope, 4),
+            "confidence": self._aggregate_confidence(count)
         }
     
+    @staticmethod
+    def _sentiment_slopes(
+        windows: List[List[Dict[str, Any]]], cancel_token: Optional[threading.Event] = None
+    ) -> List[float]:
+        """Rolling trend per session; unscored interactions are scored in one batch"""
+        unscored = [item for window in windows for item in window if item.get("sentiment") is None]
+        if unscored:
+            scores = SENTIMENT_SCORER.score_batch([item.get("question", "") for item in unscored])
+            for item, score in zip(unscored, scores):
+                item["sentiment"] = float(score)
+        slopes = []
+        for window in windows:
+            check_cancelled(cancel_token, "sentiment trend")
+            if len(window) >= 2:
+                slopes.append(SentimentScorer.trend(np.fromiter((item["sentiment"] for item in window), dtype=np.float64)))
+        return slopes
+    
     async def _analyze_topics(self, memory_data: Dict) -> Dict[str, Any]:
         """Analyze conversation topics"""
+        aggregates: InteractionAggregates = memory_data["aggregates"]
+        total = sum(aggregates.topic_counts.values())
+        clusterer = await self._get_topic_clusterer(memory_data["session_id"])
+        discovered = await clusterer.summarize()
+        main_topics = [cluster["label"] for cluster in discovered["clusters"][:3]]
         return {
             "analysis_type": "topics",
-            "main_topics": ["AI", "Programming", "Career Development"],
-            "topic_frequency": {"AI": 0.4, "Programming": 0.35, "Career": 0.25},
-            "confidence": 0.87
+            "main_topics": main_topics or self._top_keys(aggregates.topic_counts),
+            "discovered_topics": discovered["clusters"],
+            "topic_frequency": {
+                topic: round(count / total, 3) for topic, count in aggregates.topic_counts.items()
+            } if total else {},
+            "confidence": self._aggregate_confidence(aggregates.interaction_count)
         }
     
-    async def _plan_orchestration(self, goal: str, tools: List[str], constraints: Dict, max_steps: int) -> List[Dict]:
-        """Plan tool orchestration steps"""
-        return [
-            {"tool": "context_gathering", "params": {"goal": goal}},
-            {"tool": "analysis", "params": {"context": "gathered"}},
-            {"tool": "synthesis", "params": {"analysis": "completed"}}
-        ]
+    # Tools the orchestrator may call; adaptive_learning and tool_orchestration
+    # itself are excluded to avoid side effects and recursion
+    ORCHESTRATION_TOOLS = {
+        "advanced_query": "_handle_advanced_query",
+        "memory_analysis": "_handle_memory_analysis",
+        "performance_analytics": "_handle_performance_analytics",
+        "context_synthesis": "_handle_context_synthesis",
+    }
+    # Reports live counters, so like the tool cache the memo never keeps it
+    UNMEMOIZED_STEP_TOOLS = frozenset({"performance_analytics"})
     
-    async def _execute_orchestration_step(self, step: Dict) -> Dict:
-        """Execute a single orchestration step"""
-        return {
-            "tool": step["tool"],
-            "result": f"Executed {step['tool']} successfully",
-            "confidence": 0.85
-        }
+    async def _plan_orchestration(self, goal: str, tools: List[str], constraints: Dict, max_steps: int) -> List[OrchestrationStep]:
+        """Plan tool orchestration steps as a dependency graph
+        
+        Independent gathering steps feed a final context_synthesis step
+        when it is available and the step budget allows.
+        """
+        allowed = [tool for tool in (tools or self.ORCHESTRATION_TOOLS) if tool in self.ORCHESTRATION_TOOLS]
+        session_id = constraints.get("session_id")
+        
+        gatherers: List[OrchestrationStep] = []
+        if "advanced_query" in allowed:
+            gatherers.append(OrchestrationStep(step_id="knowledge", tool="advanced_query", params={
+                "question": goal,
+                "reasoning_mode": constraints.get("reasoning_mode", "analytical"),
+                "context_depth": constraints.get("context_depth", 5)
+            }))
+        if "memory_analysis" in allowed:
+            for analysis_type in ("topics", "preferences", "patterns", "sentiment", "user_profile"):
+                gatherers.append(OrchestrationStep(step_id=f"memory_{analysis_type}", tool="memory_analysis", params={
+                    "analysis_type": analysis_type,
+                    "session_id": session_id,
+                    "time_range": constraints.get("time_range", "all_time")
+                }))
+        if "performance_analytics" in allowed:
+            gatherers.append(OrchestrationStep(step_id="performance", tool="performance_analytics", params={
+                "metric_type": constraints.get("metric_type", "response_time")
+            }))
+        
+        synthesize = "context_synthesis" in allowed and gatherers and max_steps >= 2
+        gatherers = gatherers[:max_steps - 1 if synthesize else max_steps]
+        plan = list(gatherers)
+        if synthesize:
+            dependencies = [step.step_id for step in gatherers]
+            plan.append(OrchestrationStep(
+                step_id="synthesis",
+                tool="context_synthesis",
+                params={"synthesis_goal": goal, "output_format": constraints.get("output_format", "analysis")},
+                depends_on=dependencies,
+                inputs={"sources": dependencies}
+            ))
+        return plan
+    
+    async def _execute_orchestration_step(self, step: OrchestrationStep, dependency_results: Dict[str, Dict]) -> Dict[str, Any]:
+        """Execute a single orchestration step, reusing memoized results"""
+        arguments = dict(step.params)
+        for param, step_ids in step.inputs.items():
+            arguments[param] = [
+                {"type": dependency_results[step_id]["tool"], "content": dependency_results[step_id]["result"], "weight": 1.0}
+                for step_id in step_ids
+            ]
+        handler = getattr(self, self.ORCHESTRATION_TOOLS[step.tool])
+        
+        async def compute() -> str:
+            result = await handler(arguments)
+            if result.isError:
+                # Raised so the memo does not keep it and the step is not reported as ok
+                raise ToolResultError(result)
+            return "\n".join(getattr(item, "text", "") for item in result.content)
+        
+        if step.tool in self.UNMEMOIZED_STEP_TOOLS:
+            return {"result": await compute(), "cache_hit": False}
+        state_version: Tuple[Any, ...] = (self.knowledge_index.version, self.section_priors.revision)
+        if step.tool == "memory_analysis":
+            # Same stamp the materialized analysis is keyed on, so new writes invalidate
+            state_version += await self._analysis_version(
+                arguments.get("session_id"), arguments.get("time_range", "all_time")
+            )
+        key = StepResultMemo.make_key(step.tool, arguments, state_version)
+        output, cache_hit = await self.step_memo.get_or_compute(key, compute)
+        return {"result": output, "cache_hit": cache_hit}
     
-    async def _synthesize_orchestration_results(self, goal: str, results: List[Dict]) -> str:
+    async def _synthesize_orchestration_results(self, goal: str, report: Dict[str, Any]) -> str:
         """Synthesize orchestration results"""
-        return f"Goal '{goal}' achieved through {len(results)} orchestrated steps."
+        steps = report["steps"]
+        completed = [step for step in steps if step["status"] == "ok"]
+        lines = [
+            f"Goal '{goal}' processed through {len(steps)} orchestrated steps "
+            f"({len(completed)} completed).",
+            f"Wall time {report['wall_ms']}ms vs {report['sequential_ms']}ms sequential; "
+            f"critical path {' -> '.join(report['critical_path'])} ({report['critical_path_ms']}ms).",
+            ""
+        ]
+        for step in steps:
+            cached = ", cached" if step.get("cache_hit") else ""
+            reason = f": {step['result']}" if step["status"] != "ok" else ""
+            lines.append(
+                f"- **{step['step_id']}** ({step['tool']}, {step['status']}{cached}, {step['duration_ms']}ms){reason}"
+            )
+        final = next((step for step in reversed(steps) if step["status"] == "ok"), None)
+        if final:
+            lines.extend(["", final["result"]])
+        return "\n".join(lines)
     
     async def _process_sources(self, sources: List[Dict]) -> List[Dict]:
-        """Process and weight information sources"""
-        return [
+        """Process and weight information sources, collapsing near-duplicates"""
+        weighted = [
             {**source, "processed": True, "weight": source.get("weight", 1.0)}
             for source in sources
         ]
+        if len(weighted) < 2:
+            return weighted
+        loop = asyncio.get_running_loop()
+        request = current_request()
+        deduplicate = self.source_deduplicator.deduplicate  # built here, not in the worker thread
+        deduplicated = await request.run(
+            loop.run_in_executor(self.analysis_executor, deduplicate, weighted, request.cancel_token),
+            "source deduplication"
+        )
+        if len(deduplicated) < len(weighted):
+            logger.info(f"🧹 Collapsed {len(weighted)} sources into {len(deduplicated)}")
+        return deduplicated
+    
+    async def _resolve_source_references(self, sources: List[Dict], goal: str, session_id: Optional[str]) -> List[Dict]:
+        """Replace ``uri`` sources by a bounded selection of their sentences
+        
+        Chunks are split and scored in the analysis executor, so the event
+        loop only does the reading.
+        """
+        is_reference = [bool(source.get("uri")) and not source.get("content") for source in sources]
+        references = sum(is_reference)
+        if not references:
+            return sources
+        
+        goal_embedding = embed_texts([goal], self.config.retrieval_embedding_dim)[0]
+        # Share the sentence budget so the combined selection stays bounded
+        capacity = max(16, self.config.synthesis_max_sentences // references)
+        loop = asyncio.get_running_loop()
+        request = current_request()
+        resolved = []
+        for source, reference in zip(sources, is_reference):
+            if reference:
+                selector = StreamingSentenceSelector(
+                    goal_embedding, self.config.retrieval_embedding_dim, capacity, float(source.get("weight", 1.0)),
+                    self.config.source_max_sentence_chars
+                )
+                async for chunk in self._stream_source(source["uri"], session_id):
+                    await request.run(
+                        loop.run_in_executor(self.analysis_executor, selector.feed, chunk), "source streaming"
+                    )
+                content = await request.run(
+                    loop.run_in_executor(self.analysis_executor, selector.finish), "source streaming"
+                )
+                source = {**source, "content": content, "original_chars": selector.chars_read}
+            resolved.append(source)
+        return resolved
+    
+    async def _stream_source(self, uri: str, session_id: Optional[str]):
+        """Yield a referenced source in chunks of at most source_chunk_chars"""
+        if uri.startswith("memory://"):
+            async for chunk in self._stream_memory_resource(uri, session_id):
+                yield chunk
+            return
+        
+        path = self._resolve_source_path(uri)
+        
+        import aiofiles
+        
+        remaining = self.config.source_max_chars
+        async with aiofiles.open(path, "r", encoding="utf-8", errors="replace") as f:
+            while remaining > 0:
+                chunk = await f.read(min(self.config.source_chunk_chars, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    
+    def _resolve_source_path(self, uri: str) -> Path:
+        """Map a file source to a path inside the configured source roots
+        
+        Relative paths are looked up under each root in turn. Hidden files
+        and directories (``.env``, ``.git``) are never readable, including
+        through symlinks.
+        """
+        roots = [Path(root).expanduser().resolve() for root in self.config.source_roots]
+        if not roots:
+            raise ValueError("File sources are disabled; set DIGITAL_TWIN_SOURCE_ROOTS to allow them")
+        requested = Path(uri[len("file://"):] if uri.startswith("file://") else uri).expanduser()
+        candidates = [requested] if requested.is_absolute() else [root / requested for root in roots]
+        for candidate in candidates:
+            path = candidate.resolve()
+            root = next((root for root in roots if path == root or root in path.parents), None)
+            if root is None:
+                continue
+            if any(part.startswith(".") for part in path.relative_to(root).parts):
+                raise ValueError(f"Hidden files cannot be used as sources: {uri}")
+            if path.is_file() or requested.is_absolute():
+                return path
+        if requested.is_absolute():
+            raise ValueError(f"Source outside allowed roots: {uri}")
+        raise ValueError(f"Source not found under the allowed roots: {uri}")
+    
+    async def _stream_memory_resource(self, uri: str, session_id: Optional[str]):
+        """Yield memory:// resources; session history is paged from the store
+        
+        A session's history is only readable by a call made for that session.
+        """
+        if uri == "memory://agent-memory":
+            for chunk in self.serializer.iter_encode(await self._get_memory_snapshot(), self.config.source_chunk_chars):
+                yield chunk
+            return
+        prefix = "memory://session/"
+        if not uri.startswith(prefix):
+            raise ValueError(f"Unknown memory resource: {uri}")
+        
+        if not session_id or uri[len(prefix):] != session_id:
+            raise ValueError(f"{uri} is only readable with session_id set to that session")
+        memory = await self._get_session_memory(session_id)
+        if not self.memory_store.redis:
+            history = list(memory.interaction_history)
+            pages = [history[i:i + self.config.memory_page_size] for i in range(0, len(history), self.config.memory_page_size)]
+            for page in pages:
+                yield self._format_history_page(page)
+            return
+        cursor: Optional[int] = 0
+        while cursor is not None:
+            page, cursor = await self.memory_store.get_history_page(session_id, cursor)
+            if page:
+                yield self._format_history_page(page)
+    
+    @staticmethod
+    def _format_history_page(page: List[Dict[str, Any]]) -> str:
+        return "\n\n".join(
+            f"{item.get('question', '')}\n\n{item.get('response', '')}" for item in page
+        ) + "\n\n"
+    
+    async def _compress_sources(self, sources: List[Dict], goal: str) -> List[Dict]:
+        """Extractively compress sources to the synthesis token budget"""
+        loop = asyncio.get_running_loop()
+        request = current_request()
+        compressed = await request.run(
+            loop.run_in_executor(
+                self.analysis_executor, self.source_compressor.compress, sources, goal,
+                self.config.synthesis_token_budget, self.config.synthesis_max_sentences, request.cancel_token
+            ),
+            "source compression"
+        )
+        if compressed is not sources:
+            before = sum(len(source.get("content", "")) for source in sources)
+            after = sum(len(source.get("content", "")) for source in compressed)
+            logger.info(f"🗜️ Compressed synthesis sources from {before} to {after} chars")
+        return compressed
     
     async def _synthesize_information(self, sources: List[Dict], goal: str, format_type: str) -> str:
         """Synthesize information from multiple sources"""
-        return f"Synthesized {format_type} for goal: {goal} from {len(sources)} sources."
+        if not self.groq_client:
+            return f"Synthesized {format_type} for goal: {goal} from {len(sources)} sources."
+        
+        source_text = "\n\n".join(
+            f"[{source.get('type', 'source')} | weight {source.get('weight', 1.0)}]\n{source.get('content', '')}"
+            for source in sources
+        )
+        prompt = f"""
+        As DIGI-EARL, Earl's advanced AI digital twin, produce a {format_type} for this goal.
+        
+        Goal: {goal}
+        Sources:
+        {source_text}
+        
+        Weigh sources by their weight and respond in the requested format:
+        """
+        
+        try:
+            response = await current_request().run(self.groq_client.chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[
+                    {"role": "system", "content": "You are DIGI-EARL, an advanced AI digital twin with enhanced reasoning capabilities."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.config.reasoning_temperature,
+                max_tokens=1000
+            ), "LLM completion")
+            
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            logger.error(f"❌ Groq API error: {e}")
+            raise
     
     async def _process_learning_data(self, interaction_data: Dict, focus: str, feedback: Dict) -> Dict:
         """Process learning data and extract insights"""
@@ -807,9 +3797,95 @@ class AdvancedDigitalTwinServer:
             "confidence": 0.83
         }
     
-    async def _update_learned_patterns(self, insights: Dict) -> None:
+    async def _apply_feedback_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Fold a batch of feedback events into one learned-pattern write per session and focus
+        
+        The queue retries a failed batch in full, so each event records
+        which writes already include it ("priors_applied",
+        "patterns_applied") and a retry only redoes the ones that failed.
+        """
+        groups: Dict[Tuple[Optional[str], str], List[Dict]] = {}
+        ratings: Dict[str, List[int]] = {}
+        for event in batch:
+            if not event.get("priors_applied"):
+                for section_id, helpful in self._section_ratings(event).items():
+                    counts = ratings.setdefault(section_id, [0, 0])
+                    counts[0 if helpful else 1] += 1
+            if not event.get("patterns_applied"):
+                key = (event["interaction_data"].get("session_id"), event["learning_focus"])
+                groups.setdefault(key, []).append(event)
+        
+        if ratings:
+            await self._update_section_priors({k: (v[0], v[1]) for k, v in ratings.items()})
+        for event in batch:
+            event["priors_applied"] = True
+        
+        for (session_id, focus), events in groups.items():
+            group = [
+                await self._process_learning_data(event["interaction_data"], focus, event["feedback"])
+                for event in events
+            ]
+            previous_events = 0
+            if session_id:
+                memory = await self._get_session_memory(session_id)
+                previous_events = memory.learned_patterns.get(focus, {}).get("events", 0)
+            merged = {
+                "focus": focus,
+                "insights": list(dict.fromkeys(i for item in group for i in item.get("insights", []))),
+                "adaptations": list(dict.fromkeys(a for item in group for a in item.get("adaptations", []))),
+                "confidence": round(sum(item.get("confidence", 0.0) for item in group) / len(group), 3),
+                "events": previous_events + len(group),
+                "updated_at": datetime.now().isoformat()
+            }
+            await self._update_learned_patterns(merged, session_id)
+            for event in events:
+                event["patterns_applied"] = True
+        self.subscriptions.mark_changed("memory://agent-memory")
+    
+    @staticmethod
+    def _section_ratings(event: Dict[str, Any]) -> Dict[str, bool]:
+        """Per-section helpful/unhelpful verdicts carried by a feedback event
+
+        Accepts ``feedback.section_ratings`` ({section_id: bool}) or an
+        overall ``feedback.helpful`` applied to ``feedback.sections`` or,
+        failing that, the ``interaction_data.sections`` that were used.
+        """
+        feedback = event.get("feedback") or {}
+        ratings = {k: bool(v) for k, v in (feedback.get("section_ratings") or {}).items()}
+        if "helpful" in feedback:
+            sections = feedback.get("sections") or event["interaction_data"].get("sections") or []
+            for section_id in sections:
+                ratings.setdefault(section_id, bool(feedback["helpful"]))
+        return ratings
+    
+    async def _update_section_priors(self, ratings: Dict[str, Tuple[int, int]]) -> None:
+        """Persist rating counts, then fold them into the priors
+        
+        Nothing changes in memory unless the Redis write succeeded, so a
+        failed write can be retried without counting anything twice. If
+        another worker wrote in between, the local counts stay marked as
+        behind and the next shared state refresh reloads them.
+        """
+        priors = self.section_priors
+        increments = priors.fields(ratings)
+        redis_client = self.memory_store.redis
+        revision = None
+        if increments and redis_client:
+            pipe = redis_client.pipeline()
+            for field, amount in increments.items():
+                pipe.hincrby(SectionPriors.REDIS_KEY, field, amount)
+            pipe.hincrby(SectionPriors.META_KEY, "revision", 1)
+            *_, revision = await self.memory_store.timed("section_priors", pipe.execute())
+        priors.update(ratings)
+        if revision == priors.shared_revision + 1:
+            priors.shared_revision = revision
+    
+    async def _update_learned_patterns(self, insights: Dict, session_id: Optional[str] = None) -> None:
         """Update learned patterns in memory"""
-        # Implementation would update persistent memory
+        if session_id:
+            await self.memory_cache.update_fields(
+                session_id, "learned_patterns", {insights.get("focus", "general"): insights}
+            )
         logger.info(f"📚 Updated learned patterns: {insights}")
     
     async def _get_performance_metrics(self, metric_type: str = None, time_period: str = None, aggregation: str = None) -> Dict:
@@ -823,46 +3899,395 @@ class AdvancedDigitalTwinServer:
                 "success_rate": "98.5%",
                 "error_rate": "1.5%",
                 "tool_usage": {"advanced_query": 45, "memory_analysis": 23}
-            }
+            },
+            "request_outcomes": self.request_outcomes,
+            "tool_latency": self.tool_latency.summary(),
+            "redis_latency": self.memory_store.latency.summary(),
+            "tool_cache": {"hits": self.tool_cache.hits, "misses": self.tool_cache.misses},
+            "subscriptions": self.subscriptions.report()
         }
     
+    async def serve(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        """Run the configured transport until it closes or SIGTERM/SIGINT arrives, then shut down
+        
+        On a signal, in-flight calls are drained first, while the transport
+        still delivers their responses; only then is uvicorn told to exit
+        (it does not install signal handlers of its own here), and the
+        remaining shutdown steps run once it has closed its connections.
+        """
+        if self.config.transport == "http":
+            serving = asyncio.create_task(self.serve_http(sockets))
+        else:
+            serving = asyncio.create_task(self.serve_stdio())
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+        stopping = asyncio.create_task(stop.wait())
+        try:
+            await asyncio.wait({serving, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if stop.is_set():
+                logger.info("🛑 Server shutting down...")
+                await self.drain()
+                if self._http_server is not None:
+                    self._http_server.should_exit = True
+                    await asyncio.wait({serving})
+        finally:
+            await self.shutdown()
+            stopping.cancel()
+            serving.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await serving
+    
+    async def serve_stdio(self) -> None:
+        """Serve one client over stdin/stdout (desktop clients)"""
+        from mcp.server.stdio import stdio_server
+        
+        async with stdio_server() as (read_stream, write_stream):
+            logger.info("🚀 Advanced Digital Twin MCP Server running on stdio")
+            await self.server.run(
+                read_stream, write_stream, self.server.create_initialization_options(NotificationOptions())
+            )
+    
+    async def serve_http(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        """Serve many concurrent MCP sessions over streamable HTTP
+        
+        Each client gets its own MCP session (keyed by the mcp-session-id
+        header) with separate transport state, all sharing this server's
+        caches and pools. Under the pre-fork supervisor, ``sockets`` is the
+        inherited listening socket and sessions are stateless.
+        """
+        import uvicorn
+        from starlette.applications import Starlette
+        from starlette.responses import Response
+        from starlette.routing import Mount, Route
+        from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+        
+        class DrainingServer(uvicorn.Server):
+            def capture_signals(self):
+                # serve() owns SIGTERM/SIGINT so it can drain before uvicorn closes connections
+                return contextlib.nullcontext()
+        
+        session_manager = StreamableHTTPSessionManager(app=self.server, stateless=self.config.workers > 1)
+        self.connection_limiter = ConnectionLimiter(session_manager.handle_request, self.config.max_connections)
+        
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            async with session_manager.run():
+                yield
+        
+        async def descriptors(request):
+            etag = f'"{self.descriptors.etag}"'
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"etag": etag})
+            return Response(self.descriptors.serialized, media_type="application/json", headers={"etag": etag})
+        
+        app = Starlette(
+            routes=[
+                Route(f"{self.config.http_path}/descriptors", descriptors, methods=["GET"]),
+                Mount(self.config.http_path, app=self.connection_limiter),
+            ],
+            lifespan=lifespan
+        )
+        self._http_server = http_server = DrainingServer(uvicorn.Config(
+            app,
+            host=self.config.http_host,
+            port=self.config.http_port,
+            limit_concurrency=self.config.max_connections + 16,  # headroom so 503s can still be sent
+            timeout_graceful_shutdown=self.config.http_close_timeout,
+            log_level="info",
+        ))
+        logger.info(
+            f"🚀 Advanced Digital Twin MCP Server {os.getpid()} listening on "
+            f"http://{self.config.http_host}:{self.config.http_port}{self.config.http_path}"
+        )
+        await http_server.serve(sockets=sockets)
+    
+    async def drain(self) -> None:
+        """Stop intake and let in-flight calls finish, cancelling any still running at the deadline
+        
+        Must run while the transport is up so drained calls can deliver
+        their responses; ``serve`` calls it before stopping the transport.
+        Safe to call more than once.
+        """
+        if not self.accepting_calls:
+            return
+        # New calls get a retryable rejection
+        self.accepting_calls = False
+        
+        pending = {task for task in self._in_flight_calls if not task.done()}
+        if pending:
+            logger.info(f"⏳ Draining {len(pending)} in-flight tool calls")
+            _, pending = await asyncio.wait(pending, timeout=self.config.shutdown_drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"⚠️ Cancelled {len(pending)} tool calls still running at the drain deadline")
+                await asyncio.wait(pending, timeout=1.0)
+    
+    async def shutdown(self) -> None:
+        """Drain (if ``serve`` has not already), flush buffered writes, then close pools
+        
+        The flush and close steps do not need the transport, so they also
+        run after it has closed. Safe to call more than once.
+        """
+        if self._shutdown_started:
+            return
+        self._shutdown_started = True
+        
+        # 1. Stop intake and drain in-flight calls
+        await self.drain()
+        
+        # 2. Flush queued feedback, pending notifications and final metrics
+        if self._backend_connector:
+            self._backend_connector.cancel()
+        if self._analysis_refresher:
+            self._analysis_refresher.cancel()
+        await self.feedback_queue.close()
+        await self.subscriptions.close()
+        logger.info(f"📊 Final request outcomes: {self.serializer.dumps(self.request_outcomes)}")
+        
+        # 3. Close pools
+        if self.redis_client:
+            await self.redis_client.aclose()
+        if self._groq_client:
+            await self._groq_client.close()
+        self.background_cancel.set()
+        self.analysis_executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("🛑 Advanced Digital Twin MCP Server shut down")
+    
     async def _get_memory_snapshot(self) -> Dict:
         """Get current memory snapshot"""
         return {
             "active_sessions": len(self.memory_cache),
             "reasoning_chains": len(self.reasoning_chains),
             "cache_status": "active",
+            "cache": self.memory_cache.report(),
+            "feedback_queue": {**self.feedback_queue.stats, "pending": len(self.feedback_queue)},
             "memory_usage": "optimal"
         }
     
-    async def _get_reasoning_chains(self) -> Dict:
-        """Get reasoning chains data"""
+    async def _get_reasoning_chains(self, uri: str = "reasoning://chains") -> Dict:
+        """Get one page of reasoning chains
+        
+        Query parameters: ``cursor`` (from the previous page's next_cursor),
+        ``limit``, ``mode`` and ``since``/``until`` (ISO datetimes or epoch
+        seconds).
+        """
+        query = {key: values[-1] for key, values in parse_qs(urlsplit(uri).query).items()}
+        limit = min(int(query.get("limit", self.config.reasoning_page_size)), self.config.reasoning_max_page_size)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        cursor = int(query["cursor"]) if "cursor" in query else None
+        chains, next_cursor = self.reasoning_chains.page(
+            cursor=cursor,
+            limit=limit,
+            mode=query.get("mode"),
+            since=self._parse_time_filter(query.get("since")),
+            until=self._parse_time_filter(query.get("until"))
+        )
+        total = len(self.reasoning_chains)
         return {
-            "total_chains": len(self.reasoning_chains),
-            "active_chains": [chain_id for chain_id in self.reasoning_chains.keys()],
-            "average_steps": sum(len(chain) for chain in self.reasoning_chains.values()) / max(len(self.reasoning_chains), 1)
+            "total_chains": total,
+            "total_steps": self.reasoning_chains.total_steps,
+            "average_steps": self.reasoning_chains.total_steps / max(total, 1),
+            "chains_by_mode": self.reasoning_chains.mode_counts,
+            "chains": [
+                {
+                    "chain_id": chain.chain_id,
+                    "mode": chain.mode,
+                    "created": datetime.fromtimestamp(chain.created).isoformat(),
+                    "steps": len(chain.steps)
+                }
+                for chain in chains
+            ],
+            "next_cursor": str(next_cursor) if next_cursor is not None else None
         }
+    
+    @staticmethod
+    def _parse_time_filter(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+class PreforkSupervisor:
+    """Pre-forked HTTP workers sharing one listening socket and startup state
+
+    The supervisor builds the server once, moves the knowledge-index
+    embeddings into a shared read-only mapping, and then calls
+    ``gc.freeze()`` on everything built so far before forking ``workers``
+    children. The children inherit it all copy-on-write. The collector
+    never traverses frozen objects, so their pages stay shared. Each worker
+    runs its own event loop and accepts from the inherited socket, which
+    lets the kernel spread connections, and CPU-bound work, across cores.
+
+    Workers serve stateless MCP sessions because consecutive requests of
+    one client may reach different workers. Resource subscriptions
+    therefore need a single worker. SIGHUP replaces every worker with a
+    fresh fork. SIGTERM and SIGINT stop workers gracefully, escalating to
+    SIGKILL after ``worker_graceful_timeout``. Workers that die unexpectedly
+    are respawned.
+    """
+
+    def __init__(self, config: ServerConfig):
+        self.config = config
+        self.server: Optional[AdvancedDigitalTwinServer] = None
+        self.socket: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}  # pid -> monotonic start time
+        self._retiring: set = set()
+        self._stopping = False
+        self._reload = False
+        shutdown_budget = (
+            config.shutdown_drain_timeout + 1.0 + config.http_close_timeout
+            + config.feedback_drain_timeout + config.resource_notify_timeout
+        )
+        if config.worker_graceful_timeout < shutdown_budget:
+            logger.warning(
+                f"⚠️ worker_graceful_timeout ({config.worker_graceful_timeout}s) is shorter than a worst-case "
+                f"worker shutdown ({shutdown_budget}s); workers may be killed before flushing"
+            )
 
-async def main():
+    def run(self) -> None:
+        gc.disable()
+        self.server = AdvancedDigitalTwinServer(self.config)
+        # Build the lazily created retrieval state now so workers share it
+        self.server.knowledge_index.share_memory()
+        self.server.section_priors
+        self.server.source_deduplicator
+        self.socket = socket.create_server((self.config.http_host, self.config.http_port), backlog=2048)
+        self.socket.set_inheritable(True)
+        gc.collect()
+        gc.freeze()
+        
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+        logger.info(
+            f"🚀 Supervisor {os.getpid()} starting {self.config.workers} workers on "
+            f"http://{self.config.http_host}:{self.config.http_port}{self.config.http_path}"
+        )
+        try:
+            for _ in range(self.config.workers):
+                self._spawn()
+            while not self._stopping:
+                if self._reload:
+                    self._reload = False
+                    self._restart_workers()
+                self._reap(respawn=True)
+                time.sleep(0.2)
+        finally:
+            self._stop_workers()
+            self.socket.close()
+            logger.info("🛑 Supervisor stopped")
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _request_reload(self, signum, frame) -> None:
+        self._reload = True
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            gc.enable()
+            asyncio.run(self._serve_worker())
+        except BaseException as e:
+            logger.error(f"❌ Worker {os.getpid()} failed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    async def _serve_worker(self) -> None:
+        await self.server.initialize()
+        await self.server.serve(sockets=[self.socket])
+
+    def _reap(self, respawn: bool) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            if started is None or pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if respawn and not self._stopping:
+                logger.warning(f"⚠️ Worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, respawning")
+                if time.monotonic() - started < self.config.worker_restart_delay:
+                    time.sleep(self.config.worker_restart_delay)  # don't spin on a crash loop
+                self._spawn()
+
+    def _restart_workers(self) -> None:
+        """Replace every worker, starting each replacement before retiring the old one"""
+        for pid in list(self.workers):
+            if pid in self._retiring:
+                continue
+            self._spawn()
+            self._retiring.add(pid)
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        logger.info("🔄 Workers restarting")
+
+    def _stop_workers(self) -> None:
+        for pid in self.workers:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.config.worker_graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning(f"⚠️ Worker {pid} did not stop in time, killing it")
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+            del self.workers[pid]
+
+def parse_args(config: ServerConfig) -> ServerConfig:
+    """Apply command-line overrides to the environment-derived config"""
+    parser = argparse.ArgumentParser(description="Advanced Digital Twin MCP Server")
+    parser.add_argument("--transport", choices=["stdio", "http"], default=config.transport)
+    parser.add_argument("--host", default=config.http_host)
+    parser.add_argument("--port", type=int, default=config.http_port)
+    parser.add_argument("--max-connections", type=int, default=config.max_connections)
+    parser.add_argument("--workers", type=int, default=config.workers)
+    parser.add_argument("--json-format", choices=["compact", "pretty"], default=config.json_format)
+    args = parser.parse_args()
+    config.transport = args.transport
+    config.http_host = args.host
+    config.http_port = args.port
+    config.max_connections = args.max_connections
+    config.workers = args.workers
+    config.json_format = args.json_format
+    return config
+
+async def main(config: Optional[ServerConfig] = None):
     """Main server entry point"""
     # Load configuration
-    config = ServerConfig()
+    config = config or parse_args(ServerConfig())
     
     # Initialize and run server
     server = AdvancedDigitalTwinServer(config)
     await server.initialize()
-    
-    # Run the MCP server
-    async with server.server.create_session() as session:
-        await session.initialize()
-        logger.info("🚀 Advanced Digital Twin MCP Server running...")
-        
-        # Keep server running
-        try:
-            while True:
-                await asyncio.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("🛑 Server shutting down...")
+    await server.serve()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    config = parse_args(ServerConfig())
+    if config.transport == "http" and config.workers > 1:
+        PreforkSupervisor(config).run()
+    else:
+        asyncio.run(main(config))
\ No newline at end of file
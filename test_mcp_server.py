@@ -0,0 +1,969 @@
+#!/usr/bin/env python3
+"""
+Behaviour tests for the Advanced Digital Twin MCP Server subsystems
+Runs without Redis or Groq; the Redis-backed cases use fakeredis when available
+"""
+
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+mcp_server = pytest.importorskip("mcp_server", reason="MCP SDK is not installed")
+
+from mcp.shared.exceptions import McpError
+from mcp.types import ResourceUpdatedNotification
+
+logging.disable(logging.INFO)
+
+SUBSCRIBABLE = mcp_server.SUBSCRIBABLE_RESOURCES
+
+
+def offline_config(**overrides) -> "mcp_server.ServerConfig":
+    config = mcp_server.ServerConfig(redis_url="", groq_api_key="", source_roots=[])
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return config
+
+
+def interaction(question: str, sentiment: float = 0.0, age: float = 0.0) -> dict:
+    """An interaction recorded age seconds ago"""
+    return {
+        "question": question,
+        "response": "answer",
+        "sentiment": sentiment,
+        "topics": mcp_server.extract_topics(question),
+        "timestamp": datetime.fromtimestamp(time.time() - age).isoformat(),
+    }
+
+
+# Session memory
+
+@pytest.fixture(params=["in-process", "redis"])
+def memory_store(request):
+    if request.param == "in-process":
+        return mcp_server.SessionMemoryStore(offline_config())
+    fakeredis = pytest.importorskip("fakeredis")
+    return mcp_server.SessionMemoryStore(offline_config(), fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+def test_global_aggregates_cover_every_session(memory_store):
+    async def scenario():
+        for session_id in ("a", "b", "c"):
+            memory = await memory_store.load(session_id)
+            await memory_store.append_interaction(memory, interaction("python api design", 0.5))
+        before = await memory_store.get_global_version()
+        memory = await memory_store.load("a")
+        await memory_store.append_interaction(memory, interaction("career growth", -0.5, age=2 * 3600))
+        memory = await memory_store.load("b")
+        await memory_store.append_interaction(memory, interaction("react hooks", age=2 * 24 * 3600))
+        ranges = {}
+        for time_range in ("all", "last_day", "last_hour"):
+            ranges[time_range], recent = await memory_store.load_global(time_range)
+        return before, await memory_store.get_global_version(), ranges, recent
+
+    before, after, ranges, recent = asyncio.run(scenario())
+    assert after == before + 2
+    assert ranges["all"].interaction_count == 5
+    assert ranges["last_day"].interaction_count == 4
+    assert ranges["last_hour"].interaction_count == 3
+    assert [item["question"] for item in recent][-2:] == ["career growth", "react hooks"]
+
+
+def test_time_bucket_index_excludes_interactions_before_the_range():
+    index = mcp_server.TimeBucketIndex()
+    for age in (0, 30 * 60, 3 * 3600, 2 * 24 * 3600, 10 * 24 * 3600):
+        index.record(interaction("python", age=age))
+
+    counts = {name: index.query(name).interaction_count for name in mcp_server.TIME_RANGE_BUCKETS}
+    assert counts == {"last_hour": 2, "last_day": 3, "last_week": 4}
+
+
+def test_session_time_buckets_are_reloaded_from_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        writer = mcp_server.SessionMemoryStore(offline_config(), redis)
+        memory = await writer.load("s")
+        for age in (0, 30 * 60, 3 * 3600, 2 * 24 * 3600):
+            await writer.append_interaction(memory, interaction("python", age=age))
+        reloaded = await mcp_server.SessionMemoryStore(offline_config(), redis).load("s")
+        return memory, reloaded
+
+    memory, reloaded = asyncio.run(scenario())
+    for time_range in mcp_server.TIME_RANGE_BUCKETS:
+        expected = memory.time_index.query(time_range).interaction_count
+        assert reloaded.time_index.query(time_range).interaction_count == expected
+    assert reloaded.time_index.query("last_hour").interaction_count == 2
+    assert reloaded.time_index.query("last_week").interaction_count == 4
+
+
+def test_memory_cache_evicts_by_byte_budget_and_reloads():
+    async def scenario():
+        store = mcp_server.SessionMemoryStore(offline_config())
+        cache = mcp_server.TwoTierMemoryCache(store, offline_config(memory_cache_max_bytes=200))
+        await cache.append_interaction("a", interaction("x" * 150))
+        await cache.append_interaction("b", interaction("y" * 150))
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert "b" in cache and "a" not in cache
+    assert cache.report()["evictions"] == 1
+
+
+def test_failed_redis_write_evicts_the_resident_copy():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        store = mcp_server.SessionMemoryStore(offline_config(), fakeredis.FakeAsyncRedis(decode_responses=True))
+        cache = mcp_server.TwoTierMemoryCache(store, offline_config())
+        await cache.append_interaction("s", interaction("one"))
+        commit = store._commit
+
+        async def failing_commit(*args):
+            raise ConnectionError("redis went away")
+
+        store._commit = failing_commit
+        with pytest.raises(ConnectionError):
+            await cache.append_interaction("s", interaction("two"))
+        store._commit = commit
+        evicted = "s" not in cache
+        memory = await cache.get("s")
+        return evicted, [item["question"] for item in memory.interaction_history], memory.aggregates
+
+    evicted, history, aggregates = asyncio.run(scenario())
+    assert evicted
+    assert history == ["one"] and aggregates.interaction_count == 1
+
+
+def test_writes_before_redis_connects_are_persisted_on_attach():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+        section_id = server.knowledge_index.section_ids[0]
+        await server._record_interaction("early", interaction("python api design"))
+        await server.memory_cache.update_fields("early", "learned_patterns", {"style": {"events": 1}})
+        await server._update_section_priors({section_id: (2, 0)})
+
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await redis.hset(mcp_server.SectionPriors.REDIS_KEY, f"{section_id}:helpful", 3)
+        server.redis_client = redis
+        await server._attach_redis()
+
+        server.memory_cache.take_all()  # force a reload from Redis
+        memory = await server.memory_cache.get("early")
+        global_aggregates, _ = await server.memory_store.load_global("all_time")
+        return server, section_id, memory, global_aggregates
+
+    server, section_id, memory, global_aggregates = asyncio.run(scenario())
+    assert [item["question"] for item in memory.interaction_history] == ["python api design"]
+    assert memory.aggregates.interaction_count == 1 and memory.version > 0
+    assert memory.learned_patterns == {"style": {"events": 1}}
+    assert global_aggregates.interaction_count == 1
+    index = server.section_priors.position[section_id]
+    assert server.section_priors.helpful[index] == 1 + 5
+
+
+def test_redis_commands_are_timed_and_failures_counted():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config(redis_latency_window=3))
+        server.memory_store.attach(fakeredis.FakeAsyncRedis(decode_responses=True))
+        for question in ("one", "two", "three", "four"):
+            await server.memory_cache.append_interaction("s", interaction(question))
+        await server.memory_store.get_version("s")
+
+        async def unavailable():
+            raise ConnectionError("redis went away")
+
+        with pytest.raises(ConnectionError):
+            await server.memory_store.timed("hget", unavailable())
+        return await server._get_performance_metrics()
+
+    latency = asyncio.run(scenario())["redis_latency"]
+    assert latency["append_interaction"]["count"] == 3
+    assert latency["load"]["count"] == 1
+    assert latency["hget"]["count"] == 2 and latency["hget"]["errors"] == 1
+    assert latency["append_interaction"]["errors"] == 0
+
+
+def test_redis_pool_is_bounded_by_config():
+    pytest.importorskip("redis")
+
+    async def scenario():
+        config = offline_config(
+            redis_url="redis://127.0.0.1:1/0", redis_pool_size=7, redis_pool_timeout=0.5, redis_socket_timeout=0.25
+        )
+        server = mcp_server.AdvancedDigitalTwinServer(config)
+        await server._connect_backends()
+        return server
+
+    server = asyncio.run(scenario())
+    pool = server.redis_client.connection_pool
+    assert type(pool).__name__ == "BlockingConnectionPool"
+    assert pool.max_connections == 7 and pool.timeout == 0.5
+    assert pool.connection_kwargs["socket_timeout"] == 0.25
+    assert pool.connection_kwargs["socket_connect_timeout"] == 0.25
+    assert server.memory_store.redis is None
+    assert server.memory_store.latency.summary()["ping"]["errors"] == 1
+
+
+# Reasoning chains
+
+def test_reasoning_chain_pages_are_newest_first_and_evict_oldest():
+    index = mcp_server.ReasoningChainIndex(limit=5)
+    for number in range(8):
+        index.create(f"chain-{number}", "deductive" if number % 2 else "creative")
+    first, cursor = index.page(limit=3)
+    second, _ = index.page(cursor=cursor, limit=3)
+    assert [chain.chain_id for chain in first] == ["chain-7", "chain-6", "chain-5"]
+    assert [chain.chain_id for chain in second] == ["chain-4", "chain-3"]
+    assert len(index) == 5
+    assert index.mode_counts == {"deductive": 3, "creative": 2}
+    deductive, _ = index.page(mode="deductive")
+    assert [chain.chain_id for chain in deductive] == ["chain-7", "chain-5", "chain-3"]
+
+
+# Orchestration
+
+def test_step_memo_keys_normalize_free_text_only():
+    make_key = mcp_server.StepResultMemo.make_key
+    assert make_key("advanced_query", {"question": "Python  Skills"}, 1) == make_key(
+        "advanced_query", {"question": "python skills"}, 1
+    )
+    assert make_key("memory_analysis", {"session_id": "Alice"}, 1) != make_key(
+        "memory_analysis", {"session_id": "alice"}, 1
+    )
+    assert make_key("memory_analysis", {"session_id": "a"}, 1) != make_key("memory_analysis", {"session_id": "a"}, 2)
+
+
+def test_step_memo_coalesces_concurrent_computes_and_skips_failures():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        memo = mcp_server.StepResultMemo(max_entries=8, ttl=60)
+        results = await asyncio.gather(*(memo.get_or_compute("k", compute) for _ in range(3)))
+        with pytest.raises(RuntimeError):
+            await memo.get_or_compute("bad", failing)
+        with pytest.raises(RuntimeError):
+            await memo.get_or_compute("bad", failing)
+        return results, memo
+
+    results, memo = asyncio.run(scenario())
+    assert results.count(("value", False)) == 1 and results.count(("value", True)) == 2
+    assert len(calls) == 1
+    assert memo.misses == 3
+
+
+def test_step_memo_survives_cancelled_owner():
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "value"
+
+    async def scenario():
+        memo = mcp_server.StepResultMemo(max_entries=8, ttl=60)
+        owner = asyncio.ensure_future(memo.get_or_compute("k", slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(memo.get_or_compute("k", slow))
+        await asyncio.sleep(0)
+        owner.cancel()
+        return await waiter
+
+    assert asyncio.run(scenario()) == ("value", False)
+
+
+def test_failed_step_results_are_not_memoized():
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+        get_memory_data = server._get_memory_data
+        failures = [RuntimeError("store unavailable")]
+
+        async def flaky(*args):
+            if failures:
+                raise failures.pop()
+            return await get_memory_data(*args)
+
+        server._get_memory_data = flaky
+        step = mcp_server.OrchestrationStep(
+            step_id="memory", tool="memory_analysis", params={"analysis_type": "topics", "session_id": "s"}
+        )
+        with pytest.raises(mcp_server.ToolResultError, match="store unavailable"):
+            await server._execute_orchestration_step(step, {})
+        retried = await server._execute_orchestration_step(step, {})
+        repeated = await server._execute_orchestration_step(step, {})
+        return retried, repeated
+
+    retried, repeated = asyncio.run(scenario())
+    assert not retried["cache_hit"] and "failed" not in retried["result"]
+    assert repeated["cache_hit"]
+
+
+def test_orchestration_dag_runs_independent_steps_concurrently():
+    Step = mcp_server.OrchestrationStep
+    steps = [
+        Step(step_id="a", tool="t"),
+        Step(step_id="b", tool="t"),
+        Step(step_id="c", tool="t", depends_on=["a", "b"]),
+        Step(step_id="bad", tool="fail"),
+        Step(step_id="after_bad", tool="t", depends_on=["bad"]),
+    ]
+
+    async def execute(step, dependencies):
+        if step.tool == "fail":
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.05)
+        return {"result": sorted(dependencies)}
+
+    report = asyncio.run(mcp_server.OrchestrationDAG(steps, max_concurrency=4, step_timeout=5).run(execute))
+    by_id = {step["step_id"]: step for step in report["steps"]}
+    assert by_id["c"]["status"] == "ok" and by_id["c"]["result"] == ["a", "b"]
+    assert by_id["bad"]["status"] == "error"
+    assert by_id["after_bad"]["status"] == "skipped"
+    assert report["wall_ms"] < report["sequential_ms"]
+    assert report["critical_path"][-1] == "c"
+
+
+def test_orchestration_reports_tool_errors_as_failed_steps():
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+
+        async def unavailable(*args):
+            raise RuntimeError("store unavailable")
+
+        server._get_memory_data = unavailable
+        result = await server._handle_tool_orchestration({
+            "goal": "summarize python experience",
+            "available_tools": ["advanced_query", "memory_analysis", "context_synthesis"],
+            "constraints": {"session_id": "s"},
+        })
+        return result.content[0].text
+
+    text = asyncio.run(scenario())
+    assert "(1 completed)" in text
+    assert "memory_topics** (memory_analysis, error" in text and "store unavailable" in text
+    # The synthesis depends on the failed steps, so their error text never becomes a source
+    assert "synthesis** (context_synthesis, skipped" in text
+
+
+def test_orchestration_dag_rejects_cycles_and_unknown_dependencies():
+    Step = mcp_server.OrchestrationStep
+    with pytest.raises(ValueError, match="cycle"):
+        mcp_server.OrchestrationDAG(
+            [Step(step_id="a", tool="t", depends_on=["b"]), Step(step_id="b", tool="t", depends_on=["a"])], 1, 1
+        )
+    with pytest.raises(ValueError, match="Unknown"):
+        mcp_server.OrchestrationDAG([Step(step_id="a", tool="t", depends_on=["missing"])], 1, 1)
+
+
+# Source processing
+
+def test_minhash_merges_near_duplicates_and_combines_weights():
+    text = "the digital twin server answers interview questions about python projects and career history"
+    deduplicator = mcp_server.MinHashDeduplicator(threshold=0.8, permutations=64, bands=16, shingle_size=3)
+    merged = deduplicator.deduplicate([
+        {"content": text, "weight": 0.5},
+        {"content": text + " today", "weight": 0.5},
+        {"content": "completely unrelated notes on gardening tomatoes in spring", "weight": 1.0},
+    ])
+    assert len(merged) == 2
+    duplicate = next(source for source in merged if source["merged_from"] == 2)
+    assert duplicate["weight"] == 0.75
+    assert duplicate["content"].endswith("today")
+
+
+def test_deduplication_stops_when_cancelled():
+    deduplicator = mcp_server.MinHashDeduplicator(threshold=0.8, permutations=64, bands=16, shingle_size=3)
+    token = threading.Event()
+    token.set()
+    with pytest.raises(asyncio.CancelledError):
+        deduplicator.deduplicate([{"content": "some text"}], cancel_token=token)
+
+
+def test_compressor_keeps_budget_and_truncates_oversized_sentences():
+    compressor = mcp_server.ExtractiveCompressor(dim=256)
+    prose = " ".join(f"Sentence {i} mentions python projects and interview answers." for i in range(200))
+    compressed = compressor.compress([{"content": prose, "weight": 1.0}], "python", budget=100, max_sentences=500)
+    assert sum(mcp_server.estimate_tokens(source["content"]) for source in compressed) <= 100 + len(compressed)
+
+    blob = compressor.compress([{"content": "x" * 5000, "weight": 1.0}], "python", budget=100, max_sentences=500)
+    assert len(blob) == 1 and len(blob[0]["content"]) == 400
+    assert blob[0]["original_chars"] == 5000
+
+
+def test_streaming_selector_bounds_sentences_without_breaks():
+    dim = 128
+    selector = mcp_server.StreamingSentenceSelector(
+        mcp_server.embed_texts(["python"], dim)[0], dim, capacity=4, weight=1.0, max_sentence_chars=100
+    )
+    for _ in range(50):
+        selector.feed("y" * 1000)
+        assert len(selector._carry) <= 100
+    kept = selector.finish()
+    assert selector.chars_read == 50000
+    assert all(len(sentence) <= 100 for sentence in kept.split(" "))
+    assert len(kept.split(" ")) == 4
+
+
+def test_file_sources_are_confined_to_visible_files_under_roots(tmp_path):
+    (tmp_path / "notes.md").write_text("notes")
+    (tmp_path / ".env").write_text("SECRET=1")
+    (tmp_path / "link.md").symlink_to(tmp_path / ".env")
+
+    closed = mcp_server.AdvancedDigitalTwinServer(offline_config())
+    with pytest.raises(ValueError, match="disabled"):
+        closed._resolve_source_path(str(tmp_path / "notes.md"))
+
+    server = mcp_server.AdvancedDigitalTwinServer(offline_config(source_roots=[str(tmp_path)]))
+    assert server._resolve_source_path("notes.md") == tmp_path / "notes.md"
+    assert server._resolve_source_path(f"file://{tmp_path}/notes.md") == tmp_path / "notes.md"
+    for uri in (".env", "link.md", str(tmp_path / ".env")):
+        with pytest.raises(ValueError, match="Hidden"):
+            server._resolve_source_path(uri)
+    for uri in ("../etc/passwd", "/etc/passwd"):
+        with pytest.raises(ValueError):
+            server._resolve_source_path(uri)
+
+
+# Background work
+
+def test_feedback_queue_retries_and_flushes_in_hand_batch_on_close():
+    applied = []
+    failures = [1]
+
+    async def apply_batch(batch):
+        if failures:
+            failures.pop()
+            raise RuntimeError("store unavailable")
+        await asyncio.sleep(0.2)
+        applied.extend(event["event_id"] for event in batch)
+
+    async def scenario():
+        config = offline_config(feedback_flush_interval=0.01, feedback_retry_delay=0.01)
+        queue = mcp_server.FeedbackIngestQueue(apply_batch, config)
+        queue.start()
+        for number in range(5):
+            assert await queue.submit({"event_id": number})
+        await asyncio.sleep(0.1)  # first apply fails, the retry is still applying
+        config.feedback_drain_timeout = 0.01
+        await queue.close()
+        assert not await queue.submit({"event_id": 99})
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert sorted(set(applied)) == [0, 1, 2, 3, 4]
+    assert queue.stats["retries"] == 1
+    assert queue.stats["failed"] == 0
+    assert len(queue) == 0
+
+
+def test_retried_feedback_batches_are_counted_once():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        server.memory_store.attach(redis)
+        section_id = server.knowledge_index.section_ids[0]
+        batch = [{
+            "event_id": "e1",
+            "interaction_data": {"session_id": "s"},
+            "learning_focus": "style",
+            "feedback": {"section_ratings": {section_id: True}},
+        }]
+        update_learned_patterns = server._update_learned_patterns
+        failures = [RuntimeError("patterns write failed")] * 2
+
+        async def flaky(*args):
+            if failures:
+                raise failures.pop()
+            await update_learned_patterns(*args)
+
+        server._update_learned_patterns = flaky
+        for _ in range(3):
+            try:
+                await server._apply_feedback_batch(batch)
+                break
+            except RuntimeError:
+                pass
+        stored = await redis.hget(mcp_server.SectionPriors.REDIS_KEY, f"{section_id}:helpful")
+        memory = await server.memory_cache.get("s")
+        index = server.section_priors.position[section_id]
+        return int(stored), server.section_priors.helpful[index], memory.learned_patterns["style"]["events"]
+
+    stored, local, events = asyncio.run(scenario())
+    assert stored == 1 and local == 2
+    assert events == 1
+
+
+def test_failed_priors_write_leaves_priors_unchanged():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        server.memory_store.attach(redis)
+        section_id = server.knowledge_index.section_ids[0]
+
+        async def unavailable(command, awaitable):
+            awaitable.close()
+            raise ConnectionError("redis went away")
+
+        server.memory_store.timed = unavailable
+        with pytest.raises(ConnectionError):
+            await server._update_section_priors({section_id: (1, 0)})
+        return server.section_priors.helpful[server.section_priors.position[section_id]]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_workers_pick_up_each_others_priors_and_questions():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis_server = fakeredis.FakeServer()
+        workers = []
+        for _ in range(2):
+            worker = mcp_server.AdvancedDigitalTwinServer(offline_config())
+            worker.redis_client = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+            await worker._attach_redis()
+            workers.append(worker)
+        writer, reader = workers
+        section_id = writer.knowledge_index.section_ids[0]
+        await writer._update_section_priors({section_id: (2, 0)})
+        await writer._record_interaction("s", interaction("python api design"))
+
+        cursors = [await worker._refresh_shared_state("0-0") for worker in workers]
+        index = reader.section_priors.position[section_id]
+        return writer, reader, index, cursors
+
+    writer, reader, index, cursors = asyncio.run(scenario())
+    assert reader.section_priors.helpful[index] == 3
+    assert reader.section_priors.shared_revision == writer.section_priors.shared_revision == 1
+    assert list(reader.global_topics.pending) == ["python api design"]
+    assert list(writer.global_topics.pending) == ["python api design"]
+    assert cursors[0] == cursors[1] != "0-0"
+
+
+def test_section_priors_bias_reorders_equally_similar_sections():
+    sections = [
+        {"id": id_, "title": "Python", "content": "Python services and APIs"} for id_ in ("a", "b", "c")
+    ]
+    index = mcp_server.KnowledgeIndex(sections, dim=64)
+    priors = mcp_server.SectionPriors(index.section_ids, strength=0.2)
+    assert not priors.bias.any()
+
+    priors.update({"a": (0, 8), "b": (8, 0), "unknown": (5, 0)})
+    assert priors.fields({"b": (1, 0), "unknown": (5, 0)}) == {"b:helpful": 1}
+    assert priors.bias[0] == pytest.approx(0.2 * (1 / 10 - 0.5))
+    assert priors.bias[1] == pytest.approx(0.2 * (9 / 10 - 0.5))
+    assert priors.bias[2] == 0 and priors.revision == 1
+
+    ranked = [section["id"] for section, _ in index.search("python apis", 3, priors.bias)]
+    assert ranked == ["b", "c", "a"]
+    assert priors.increments() == {"a:unhelpful": 8, "b:helpful": 8}
+
+
+def test_feedback_queue_drops_batch_after_max_attempts():
+    async def apply_batch(batch):
+        raise RuntimeError("broken")
+
+    async def scenario():
+        config = offline_config(feedback_flush_interval=0.01, feedback_retry_delay=0.001, feedback_max_attempts=3)
+        queue = mcp_server.FeedbackIngestQueue(apply_batch, config)
+        queue.start()
+        await queue.submit({"event_id": 1})
+        await asyncio.sleep(0.2)
+        await queue.close()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.stats["failed"] == 1
+    assert queue.stats["retries"] == 2
+
+
+def test_topic_clusterer_bounds_pending_and_folds_in_background():
+    async def scenario():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            clusterer = mcp_server.TopicClusterer(
+                n_clusters=3, dim=64, refresh_after=4, max_pending=8, executor=executor
+            )
+            questions = ["python api design", "career interview tips", "react frontend build"] * 10
+            for question in questions:
+                clusterer.add(question)
+            assert len(clusterer.pending) <= 8
+            summary = await clusterer.summarize()
+            while clusterer._fitting is not None:
+                await asyncio.sleep(0.01)
+            return clusterer, summary
+
+    clusterer, summary = asyncio.run(scenario())
+    assert summary["clusters"]
+    assert clusterer.seen + len(clusterer.pending) + clusterer.dropped == 30
+
+
+# End to end over the MCP protocol
+
+def with_client(scenario, config=None, **session_options):
+    """Run scenario(server, client) against a started server over an in-memory MCP session"""
+    memory_module = pytest.importorskip("mcp.shared.memory")
+
+    async def run():
+        server = mcp_server.AdvancedDigitalTwinServer(config or offline_config())
+        await server.initialize()
+        try:
+            async with memory_module.create_connected_server_and_client_session(
+                server.server, **session_options
+            ) as client:
+                return await scenario(server, client)
+        finally:
+            await server.shutdown()
+
+    return asyncio.run(run())
+
+
+def test_tools_over_mcp_session():
+    async def scenario(server, client):
+        tools = await client.list_tools()
+        query = await client.call_tool("advanced_query", {"question": "python experience", "session_id": "e2e"})
+        analysis = await client.call_tool("memory_analysis", {"analysis_type": "topics", "session_id": "e2e"})
+        invalid = await client.call_tool("advanced_query", {"question": ""})
+        return tools, query, analysis, invalid, server.request_outcomes
+
+    started = time.perf_counter()
+    tools, query, analysis, invalid, outcomes = with_client(scenario)
+    assert {tool.name for tool in tools.tools} >= {"advanced_query", "memory_analysis", "tool_orchestration"}
+    assert not query.isError and query.content[0].text
+    assert not analysis.isError
+    assert invalid.isError and outcomes["advanced_query"] == {"ok": 1, "error": 1}
+    assert time.perf_counter() - started < 30
+
+
+def test_materialized_analyses_are_versioned_and_bounded():
+    cache = mcp_server.MaterializedAnalysisCache(max_entries=2, hot_window=60.0)
+    cache.put(("sentiment", "a", "all_time"), (1, 0), "first")
+    assert cache.get(("sentiment", "a", "all_time"), (1, 0)) == "first"
+    assert cache.get(("sentiment", "a", "all_time"), (2, 0)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.put(("topics", "a", "all_time"), (1, 0), "topics")
+    cache._entries[("topics", "a", "all_time")].last_hit -= 120
+    assert cache.hot_keys() == [(("sentiment", "a", "all_time"), (1, 0))]
+    cache.put(("patterns", "a", "all_time"), (1, 0), "patterns")
+    assert cache.get(("sentiment", "a", "all_time"), (1, 0)) is None
+
+
+def test_analyses_are_reused_until_a_write_and_hot_ones_refresh_in_background():
+    async def scenario(server, client):
+        arguments = {"analysis_type": "user_profile", "session_id": "dash"}
+        await server._record_interaction("dash", interaction("python api design"))
+        first = await client.call_tool("memory_analysis", arguments)
+        again = await client.call_tool("memory_analysis", arguments)
+        hits = server.analysis_cache.hits
+
+        await server._record_interaction("dash", interaction("career growth"))
+        key = ("user_profile", "dash", "all_time")
+        version = await server._analysis_version("dash", "all_time")
+        for _ in range(500):
+            if server.analysis_cache._entries[key].version == version:
+                break
+            await asyncio.sleep(0.01)
+        polled = await client.call_tool("memory_analysis", arguments)
+        return first, again, hits, polled, server.analysis_cache.hits
+
+    config = offline_config(analysis_refresh_interval=0.01)
+    first, again, hits, polled, hits_after_refresh = with_client(scenario, config)
+    assert again.content[0].text == first.content[0].text and hits == 1
+    assert json.loads(first.content[0].text)["interactions"] == 1
+    assert json.loads(polled.content[0].text)["interactions"] == 2
+    assert hits_after_refresh == 2
+
+
+def test_sentiment_scorer_flips_negated_terms_and_scores_in_batch():
+    scores = mcp_server.SENTIMENT_SCORER.score_batch(
+        ["this is great", "this is not great", "no opinion", "helpful but slow"]
+    )
+    assert list(scores) == pytest.approx([1.0, -1.0, 0.0, 0.2])
+    assert mcp_server.SentimentScorer.trend(mcp_server.np.array([-0.5, 0.0, 0.5])) == pytest.approx(0.5)
+
+
+def test_sentiment_trend_only_uses_interactions_inside_the_range():
+    async def scenario(server, client):
+        for age, sentiment in ((3 * 3600, -0.9), (2 * 3600, 0.0), (3600 + 600, 0.9)):
+            await server._record_interaction("mood", interaction("older", sentiment, age=age))
+        for age, sentiment in ((30 * 60, 0.5), (20 * 60, 0.0), (10 * 60, -0.5)):
+            await server._record_interaction("mood", interaction("recent", sentiment, age=age))
+        trends = {}
+        for time_range in ("last_hour", "last_day"):
+            result = await client.call_tool(
+                "memory_analysis", {"analysis_type": "sentiment", "session_id": "mood", "time_range": time_range}
+            )
+            trends[time_range] = json.loads(result.content[0].text)
+        return trends
+
+    trends = with_client(scenario)
+    assert trends["last_hour"]["sentiment_trend"] == "declining"
+    assert trends["last_hour"]["trend_slope"] == pytest.approx(-0.5)
+    assert trends["last_day"]["trend_slope"] != trends["last_hour"]["trend_slope"]
+
+
+def test_serializer_encodes_rich_values_compactly_or_pretty():
+    value = {
+        "when": datetime(2024, 5, 1, 12, 30),
+        "tags": {"python"},
+        "recent": mcp_server.deque([1, 2]),
+        "aggregates": mcp_server.InteractionAggregates(interaction_count=3),
+        "scores": mcp_server.np.array([0.5, 1.0]),
+        "wide": 2 ** 70,
+        "text": "café",
+    }
+    compact = mcp_server.JsonSerializer().dumps(value)
+    pretty = mcp_server.JsonSerializer(pretty=True).dumps(value)
+
+    decoded = json.loads(compact)
+    assert json.loads(pretty) == decoded
+    assert decoded["when"] == "2024-05-01T12:30:00"
+    assert decoded["tags"] == ["python"] and decoded["recent"] == [1, 2]
+    assert decoded["aggregates"]["interaction_count"] == 3
+    assert decoded["scores"] == [0.5, 1.0] and decoded["wide"] == 2 ** 70
+    assert "café" in compact and ": " not in compact and "\n" not in compact
+    assert "\n  " in pretty
+
+
+def test_serializer_iter_encode_matches_dumps_in_chunks():
+    serializer = mcp_server.JsonSerializer()
+    value = {"items": [{"index": index, "text": "x" * 50} for index in range(200)]}
+    chunks = list(serializer.iter_encode(value, chunk_size=1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+    assert json.loads("".join(chunks)) == json.loads(serializer.dumps(value)) == value
+
+
+def test_descriptors_carry_a_stable_etag():
+    first = mcp_server.DescriptorRegistry(mcp_server.build_tool_definitions(), mcp_server.build_resource_definitions())
+    second = mcp_server.DescriptorRegistry(mcp_server.build_tool_definitions(), mcp_server.build_resource_definitions())
+    fewer = mcp_server.DescriptorRegistry(mcp_server.build_tool_definitions()[1:], mcp_server.build_resource_definitions())
+    assert first.etag == second.etag != fewer.etag
+    assert first.serialized == second.serialized
+
+    async def scenario(server, client):
+        return server, await client.list_tools(), await client.list_resources()
+
+    server, tools, resources = with_client(scenario)
+    assert tools.meta == resources.meta == {"etag": server.descriptors.etag}
+    assert [tool.name for tool in tools.tools] == [tool.name for tool in server.descriptors.tools]
+
+
+def test_descriptors_endpoint_revalidates_with_if_none_match():
+    httpx = pytest.importorskip("httpx")
+    pytest.importorskip("uvicorn")
+
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        url = f"http://127.0.0.1:{listener.getsockname()[1]}/mcp/descriptors"
+        serving = asyncio.create_task(server.serve_http(sockets=[listener]))
+        try:
+            async with httpx.AsyncClient() as http:
+                for _ in range(200):
+                    try:
+                        full = await http.get(url)
+                        break
+                    except httpx.ConnectError:
+                        await asyncio.sleep(0.02)
+                revalidated = await http.get(url, headers={"if-none-match": full.headers["etag"]})
+        finally:
+            server._http_server.should_exit = True
+            await serving
+            listener.close()
+        return server, full, revalidated
+
+    server, full, revalidated = asyncio.run(scenario())
+    assert full.status_code == 200 and full.content == server.descriptors.serialized
+    assert full.headers["etag"] == f'"{server.descriptors.etag}"'
+    assert revalidated.status_code == 304 and not revalidated.content
+
+
+def test_drain_rejects_new_calls_and_lets_in_flight_ones_finish():
+    async def scenario(server, client):
+        gather_context = server._gather_context
+
+        async def slow_gather(*args):
+            await asyncio.sleep(0.3)
+            return await gather_context(*args)
+
+        server._gather_context = slow_gather
+        in_flight = asyncio.create_task(client.call_tool("advanced_query", {"question": "python experience"}))
+        while not server._in_flight_calls:
+            await asyncio.sleep(0.01)
+        draining = asyncio.create_task(server.drain())
+        await asyncio.sleep(0.05)
+        waited = not draining.done()
+        rejected = await client.call_tool("advanced_query", {"question": "career growth"})
+        finished = await in_flight
+        await draining
+        return waited, rejected, finished, server.request_outcomes["advanced_query"]
+
+    waited, rejected, finished, outcomes = with_client(scenario)
+    assert waited
+    assert rejected.isError and "shutting down" in rejected.content[0].text
+    assert not finished.isError
+    assert outcomes == {"ok": 1, "rejected": 1}
+
+
+def test_drain_cancels_calls_still_running_at_the_deadline():
+    async def scenario():
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config(shutdown_drain_timeout=0.05))
+        stuck = asyncio.create_task(asyncio.sleep(10))
+        server._in_flight_calls.add(stuck)
+        started = time.perf_counter()
+        await server.drain()
+        return stuck, time.perf_counter() - started
+
+    stuck, elapsed = asyncio.run(scenario())
+    assert stuck.cancelled() and elapsed < 2
+
+
+def test_shutdown_flushes_feedback_before_closing_redis_and_runs_once():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis_server = fakeredis.FakeServer()
+        server = mcp_server.AdvancedDigitalTwinServer(offline_config())
+        await server.initialize()
+        server.redis_client = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+        server.memory_store.attach(server.redis_client)
+        section_id = server.knowledge_index.section_ids[0]
+        await server.feedback_queue.submit({
+            "event_id": "e1",
+            "interaction_data": {"session_id": "s"},
+            "learning_focus": "style",
+            "feedback": {"section_ratings": {section_id: True}},
+        })
+
+        steps = []
+        for owner, name, label in (
+            (server, "drain", "drain"),
+            (server.feedback_queue, "close", "feedback"),
+            (server.subscriptions, "close", "subscriptions"),
+            (server.redis_client, "aclose", "redis"),
+        ):
+            def record(original=getattr(owner, name), label=label):
+                async def wrapper():
+                    steps.append(label)
+                    await original()
+                return wrapper
+            setattr(owner, name, record())
+
+        await server.shutdown()
+        await server.shutdown()
+        observer = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+        stored = await observer.hget(mcp_server.SectionPriors.REDIS_KEY, f"{section_id}:helpful")
+        return server, steps, stored
+
+    server, steps, stored = asyncio.run(scenario())
+    assert steps == ["drain", "feedback", "subscriptions", "redis"]
+    assert stored == "1"
+    assert not server.accepting_calls and server.analysis_executor._shutdown
+
+
+def test_resources_read_over_mcp_session():
+    async def scenario(server, client):
+        for mode in ("analytical", "creative", "analytical"):
+            await client.call_tool(
+                "advanced_query", {"question": "python experience", "reasoning_mode": mode, "session_id": "e2e"}
+            )
+        reads = {}
+        for uri in SUBSCRIBABLE:
+            result = await client.read_resource(uri)
+            reads[uri] = result.contents[0]
+        first = json.loads((await client.read_resource("reasoning://chains?limit=2")).contents[0].text)
+        rest = json.loads(
+            (await client.read_resource(f"reasoning://chains?limit=2&cursor={first['next_cursor']}")).contents[0].text
+        )
+        creative = json.loads((await client.read_resource("reasoning://chains?mode=creative")).contents[0].text)
+        with pytest.raises(McpError):
+            await client.read_resource("memory://unknown")
+        return reads, first, rest, creative
+
+    reads, first, rest, creative = with_client(scenario)
+    for content in reads.values():
+        assert content.mimeType == "application/json"
+        json.loads(content.text)
+    assert json.loads(reads["reasoning://chains"].text)["total_chains"] == 3
+    assert len(first["chains"]) == 2 and len(rest["chains"]) == 1 and rest["next_cursor"] is None
+    assert [chain["mode"] for chain in creative["chains"]] == ["creative"]
+
+
+def test_subscribers_are_notified_and_can_reread_the_resource():
+    updated = []
+    notified = asyncio.Event()
+
+    async def on_message(message):
+        root = getattr(message, "root", None)
+        if isinstance(root, ResourceUpdatedNotification):
+            updated.append(str(root.params.uri))
+            notified.set()
+
+    async def scenario(server, client):
+        capabilities = client.get_server_capabilities()
+        await client.subscribe_resource("reasoning://chains")
+        for _ in range(3):
+            await client.call_tool("advanced_query", {"question": "python experience", "session_id": "sub"})
+        await asyncio.wait_for(notified.wait(), 5)
+        chains = json.loads((await client.read_resource("reasoning://chains")).contents[0].text)
+        await client.unsubscribe_resource("reasoning://chains")
+        notified.clear()
+        await client.call_tool("advanced_query", {"question": "python experience", "session_id": "sub"})
+        await asyncio.sleep(0.3)
+        return capabilities, chains, notified.is_set(), server.subscriptions.stats
+
+    config = offline_config(resource_notify_interval=0.5, tool_rate_limits={})
+    capabilities, chains, notified_after_unsubscribe, stats = with_client(
+        scenario, config, message_handler=on_message
+    )
+    assert capabilities.resources.subscribe
+    assert updated and set(updated) == {"reasoning://chains"}
+    assert len(updated) <= 2  # the burst after the first notification is coalesced into one
+    assert chains["total_chains"] >= 1
+    assert not notified_after_unsubscribe
+    assert stats["notifications"] == len(updated)
+
+
+def test_tool_cache_shares_synthesis_results_but_not_errors_or_live_state():
+    sources = [{"type": "note", "content": "Built a python api for interview practice."}]
+
+    async def scenario(server, client):
+        arguments = {"sources": sources, "synthesis_goal": "summarize"}
+        first = await client.call_tool("context_synthesis", arguments)
+        second = await client.call_tool("context_synthesis", arguments)
+        for _ in range(2):
+            await client.call_tool("context_synthesis", {"sources": sources, "synthesis_goal": ""})
+        metrics = []
+        for _ in range(2):
+            result = await client.call_tool("performance_analytics", {"metric_type": "response_time"})
+            metrics.append(json.loads(result.content[0].text)["request_outcomes"])
+        return first, second, metrics, server.tool_cache
+
+    first, second, metrics, tool_cache = with_client(scenario, offline_config(tool_rate_limits={}))
+    assert first.content[0].text == second.content[0].text
+    assert tool_cache.hits == 1 and tool_cache.misses == 3
+    assert metrics[0] != metrics[1]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the Advanced Digital Twin MCP Server
+Parses `python -X importtime` to keep heavy dependencies off the import and
+construction path, and keeps the server's own import and construction cost
+within budget
+"""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+import pytest
+
+SERVER_DIR = Path(__file__).parent
+
+# Loaded on first use, never at import or construction
+LAZY_MODULES = {"numpy", "sklearn", "groq", "redis", "aiofiles"}
+
+# Import cost of mcp_server on top of the MCP SDK, which is always needed
+IMPORT_BUDGET_MS = float(os.getenv("MCP_IMPORT_BUDGET_MS", "300"))
+
+# Cost of AdvancedDigitalTwinServer(ServerConfig()) once the module is imported
+CONSTRUCT_BUDGET_MS = float(os.getenv("MCP_CONSTRUCT_BUDGET_MS", "50"))
+
+CONSTRUCT_STATEMENT = (
+    "import time, mcp_server; started = time.perf_counter(); "
+    "mcp_server.AdvancedDigitalTwinServer(mcp_server.ServerConfig()); "
+    "print((time.perf_counter() - started) * 1000)"
+)
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def measure(statement: str) -> Tuple[Dict[str, float], str]:
+    """Cumulative import time in ms of every module first imported by `statement`, and its stdout
+
+    Runs twice so the measured run uses compiled bytecode, like a real launch.
+    """
+    for _ in range(2):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", statement],
+            cwd=SERVER_DIR,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+    if result.returncode != 0:
+        if "No module named 'mcp'" in result.stderr:
+            pytest.skip("MCP SDK is not installed")
+        pytest.fail(f"`{statement}` failed:\n{result.stderr[-2000:]}")
+
+    timings: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2)) / 1000
+    return timings, result.stdout
+
+
+@pytest.fixture(scope="module")
+def import_timings() -> Dict[str, float]:
+    return measure("import mcp_server")[0]
+
+
+@pytest.fixture(scope="module")
+def construction() -> Tuple[Dict[str, float], str]:
+    return measure(CONSTRUCT_STATEMENT)
+
+
+def test_heavy_dependencies_are_lazy(import_timings):
+    """numpy, sklearn, groq, redis and aiofiles must not load at import"""
+    loaded = {name.split(".")[0] for name in import_timings} & LAZY_MODULES
+    assert not loaded, f"Imported eagerly: {sorted(loaded)}"
+
+
+def test_import_time_budget(import_timings):
+    """mcp_server's own import cost stays within IMPORT_BUDGET_MS"""
+    own_ms = import_timings["mcp_server"] - import_timings.get("mcp", 0.0)
+    assert own_ms <= IMPORT_BUDGET_MS, (
+        f"Importing mcp_server took {own_ms:.0f}ms beyond the MCP SDK "
+        f"(budget {IMPORT_BUDGET_MS:.0f}ms)"
+    )
+
+
+def test_construction_is_lazy(construction):
+    """Building the server loads none of the heavy dependencies either"""
+    timings, _ = construction
+    loaded = {name.split(".")[0] for name in timings} & LAZY_MODULES
+    assert not loaded, f"Loaded while constructing the server: {sorted(loaded)}"
+
+
+def test_construction_time_budget(construction):
+    """Constructing the server stays within CONSTRUCT_BUDGET_MS"""
+    construct_ms = float(construction[1].strip().splitlines()[-1])
+    assert construct_ms <= CONSTRUCT_BUDGET_MS, (
+        f"Constructing the server took {construct_ms:.0f}ms (budget {CONSTRUCT_BUDGET_MS:.0f}ms)"
+    )